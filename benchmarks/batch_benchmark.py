@@ -0,0 +1,37 @@
+"""
+throughput of Detector.predict_batch against the batch size
+usage: python -m benchmarks.batch_benchmark [max_batch_size] [repeats]
+
+Runs the backend selected by configs.INFER, so the model files and the
+inference library have to be installed.
+"""
+import sys
+import time
+
+import numpy as np
+
+from infers.load_infer import get_infer
+
+
+def main(max_batch_size=8, repeats=5):
+    infer = get_infer()
+    if not infer:
+        return
+    detector = infer.Detector()
+    frame = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    print('%6s %12s %12s' % ('batch', 'ms / batch', 'frames / s'))
+    batch_size = 1
+    while batch_size <= max_batch_size:
+        frames = [frame] * batch_size
+        detector.predict_batch(frames)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            detector.predict_batch(frames)
+        elapsed = (time.perf_counter() - start) / repeats
+        print('%6d %12.1f %12.2f' % (batch_size, elapsed * 1000,
+                                     batch_size / elapsed))
+        batch_size *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
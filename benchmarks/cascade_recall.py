@@ -0,0 +1,62 @@
+"""
+recall lost by the cascade compared with running the full detector on
+every frame, for a range of screener thresholds
+usage: python -m benchmarks.cascade_recall <video or image dir> [failure_num]
+
+A frame counts as positive when the full detector finds more than
+failure_num boxes, like LocalMonitor._handler does.
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+
+import configs
+from infers.load_infer import get_infer
+from tools.cascade import LowResScreener, screen_score
+
+
+THRESHOLDS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5]
+
+
+def read_frames(source):
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield frame
+        return
+    capture = cv2.VideoCapture(source)
+    while True:
+        retval, frame = capture.read()
+        if not retval:
+            break
+        yield frame
+    capture.release()
+
+
+def main(source, failure_num=0):
+    infer = get_infer()
+    if not infer:
+        return
+    detector = infer.Detector()
+    if configs.CASCADE['screener'] == 'low_res':
+        screener = LowResScreener(detector, configs.CASCADE['screen_size'])
+    else:
+        screener = get_infer(configs.CASCADE['screener']).Detector()
+    scores, positives = [], []
+    for frame in read_frames(source):
+        scores.append(screen_score(screener.predict(frame)))
+        positives.append(detector.predict(frame).num > failure_num)
+    scores, positives = np.array(scores), np.array(positives)
+    print('frames: %d positives: %d' % (len(scores), positives.sum()))
+    print('%10s %12s %10s' % ('threshold', 'stage two %', 'recall'))
+    for threshold in THRESHOLDS:
+        invoked = scores >= threshold
+        recall = (invoked & positives).sum() / max(positives.sum(), 1)
+        print('%10.2f %12.1f %10.3f' % (threshold, invoked.mean() * 100, recall))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *[int(arg) for arg in sys.argv[2:3]])
@@ -0,0 +1,64 @@
+"""
+compare the mp.Queue frame handoff with SharedFrameRing
+usage: python -m benchmarks.frame_ring_benchmark [frame_num]
+"""
+import sys
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+from tools.frame_ring import SharedFrameRing
+
+
+RESOLUTIONS = {
+    '720p': (720, 1280, 3),
+    '1080p': (1080, 1920, 3),
+}
+
+
+def _producer(channel, shape, frame_num):
+    frame = np.random.randint(0, 255, shape, dtype=np.uint8)
+    for _ in range(frame_num):
+        channel.put({'frame': frame, 'capture_time': time.monotonic()})
+
+
+def _consume(channel, frame_num):
+    latencies = []
+    start = None
+    for _ in range(frame_num):
+        data = channel.get()
+        latencies.append(time.monotonic() - data['capture_time'])
+        if start is None:
+            start = time.monotonic()
+        # touch the pixels like the handler would
+        data['frame'][::64, ::64].sum()
+    elapsed = time.monotonic() - start
+    return (frame_num - 1) / elapsed, latencies
+
+
+def run(channel, shape, frame_num):
+    producer = mp.Process(target=_producer, args=(channel, shape, frame_num))
+    producer.start()
+    fps, latencies = _consume(channel, frame_num)
+    producer.join()
+    latencies = np.array(latencies) * 1000
+    return fps, np.median(latencies), np.percentile(latencies, 95)
+
+
+def main(frame_num=200):
+    print('%-6s %-8s %10s %12s %12s' % ('res', 'channel', 'fps',
+                                        'p50 ms', 'p95 ms'))
+    for name, shape in RESOLUTIONS.items():
+        ring = SharedFrameRing(slot_num=4, max_shape=shape)
+        channels = [('queue', mp.Queue(maxsize=4)), ('ring', ring)]
+        for channel_name, channel in channels:
+            fps, p50, p95 = run(channel, shape, frame_num)
+            print('%-6s %-8s %10.1f %12.2f %12.2f'
+                  % (name, channel_name, fps, p50, p95))
+        ring.close()
+        ring.unlink()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
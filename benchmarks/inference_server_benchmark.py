@@ -0,0 +1,84 @@
+"""
+memory and throughput of one detector per monitor process against one
+shared inference server (InferenceWorkerPool with a single worker and
+micro-batching) for 1, 4 and 8 monitors
+usage: python -m benchmarks.inference_server_benchmark [seconds] [batch_window]
+
+Runs the backend selected by configs.INFER, so the model files and the
+inference library have to be installed. RSS is read from /proc, so
+Linux only. Pages shared between processes are counted once per process.
+"""
+import sys
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+from infers.load_infer import get_predictor
+from infers.worker_pool import InferenceWorkerPool
+
+
+MONITOR_NUMS = (1, 4, 8)
+FRAME_SHAPE = (1080, 1920, 3)
+
+
+def rss_mb(pid='self'):
+    with open('/proc/%s/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.
+    return 0.
+
+
+def _monitor(make_predictor, start, seconds, result):
+    predictor = make_predictor()
+    frame = np.random.randint(0, 255, FRAME_SHAPE, dtype=np.uint8)
+    predictor.predict(frame)
+    start.wait()
+    frame_num = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        predictor.predict(frame)
+        frame_num += 1
+    result.put((frame_num, rss_mb()))
+
+
+def run(make_predictor, monitor_num, seconds):
+    start = mp.Event()
+    result = mp.Queue()
+    monitors = [mp.Process(target=_monitor,
+                           args=(make_predictor, start, seconds, result))
+                for _ in range(monitor_num)]
+    for monitor in monitors:
+        monitor.start()
+    # give every monitor time to load and warm up
+    time.sleep(1)
+    start.set()
+    reports = [result.get() for _ in monitors]
+    for monitor in monitors:
+        monitor.join()
+    frame_num = sum(report[0] for report in reports)
+    return frame_num / seconds, sum(report[1] for report in reports)
+
+
+def main(seconds=10, batch_window=0.02):
+    print('%-10s %8s %14s %12s' % ('mode', 'monitors', 'frames / s', 'rss MB'))
+    for monitor_num in MONITOR_NUMS:
+        fps, rss = run(get_predictor, monitor_num, seconds)
+        print('%-10s %8d %14.2f %12.1f' % ('separate', monitor_num, fps, rss))
+    pool = InferenceWorkerPool(worker_num=1, batch_window=batch_window).start()
+    try:
+        server_pid = pool.status()['workers'][0]['pid']
+        for monitor_num in MONITOR_NUMS:
+            fps, rss = run(lambda: pool.client().connect(), monitor_num, seconds)
+            rss += rss_mb(server_pid)
+            print('%-10s %8d %14.2f %12.1f' % ('shared', monitor_num, fps, rss))
+        worker = pool.status()['workers'][0]
+        print('mean micro-batch: %.2f'
+              % (worker['served'] / float(max(worker['batches'], 1))))
+    finally:
+        pool.stop()
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:3]])
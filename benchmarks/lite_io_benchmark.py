@@ -0,0 +1,60 @@
+"""
+per-stage timing of the Paddle Lite Detector with list and numpy tensor io
+usage: python -m benchmarks.lite_io_benchmark [repeats]
+
+Without paddlelite or configs.PADDLELITE_MODEL only the host side
+conversions are timed.
+"""
+import sys
+import time
+
+import numpy as np
+
+
+def time_conversions(repeats):
+    image = np.random.rand(1, 3, 608, 608).astype(np.float32)
+    boxes = np.random.rand(100, 6).astype(np.float32)
+    cases = {
+        'feed tolist': lambda: image.flatten().tolist(),
+        'feed numpy': lambda: np.ascontiguousarray(image, dtype=np.float32),
+        'fetch list': lambda: np.array(boxes.flatten().tolist()).reshape(-1, 6),
+        'fetch numpy': lambda: np.asarray(boxes, dtype=np.float64).reshape(-1, 6),
+    }
+    for name, func in cases.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            func()
+        print('%-12s %8.2f ms' % (name, (time.perf_counter() - start) / repeats * 1000))
+
+
+def time_detector(repeats):
+    from infers import paddlelite_infer
+
+    detector = paddlelite_infer.Detector()
+    frame = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    modes = [('list', False)]
+    if detector._numpy_io:
+        modes.append(('numpy', True))
+    print('%-6s' % 'io' + ''.join('%12s' % stage for stage in detector.STAGES))
+    for name, numpy_io in modes:
+        detector._numpy_io = numpy_io
+        detector.predict(frame)
+        total = dict.fromkeys(detector.STAGES, 0.)
+        for _ in range(repeats):
+            detector.predict(frame)
+            for stage, seconds in detector.last_timings.items():
+                total[stage] += seconds
+        print('%-6s' % name + ''.join('%12.2f' % (total[stage] / repeats * 1000)
+                                      for stage in detector.STAGES))
+
+
+def main(repeats=20):
+    time_conversions(repeats)
+    try:
+        time_detector(repeats)
+    except (ImportError, RuntimeError) as e:
+        print('skip detector timing: %s' % e)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
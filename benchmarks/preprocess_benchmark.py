@@ -0,0 +1,60 @@
+"""
+compare the Resize/Normalize/Permute chain with FusedPreprocess
+usage: python -m benchmarks.preprocess_benchmark [repeats]
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import configs
+from tools.preprocess import Resize, Normalize, Permute, FusedPreprocess
+
+
+RESOLUTIONS = {
+    '720p': (720, 1280, 3),
+    '1080p': (1080, 1920, 3),
+}
+
+
+def chain_preprocess(image, ops):
+    im_info = {
+        'scale': [1., 1.],
+        'origin_shape': image.shape[:2],
+        'resize_shape': image.shape[:2],
+    }
+    im = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    for operator in ops:
+        im, im_info = operator(im, im_info)
+    return np.array((im,)).astype('float32'), im_info
+
+
+def timeit(func, repeats):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main(repeats=50):
+    param = configs.IMAGE_PREPROCESS_PARAM
+    ops = [Resize(**param['Resize']),
+           Normalize(**param['Normalize']),
+           Permute(**param['Permute'])]
+    fused = FusedPreprocess(param)
+    print('%-6s %10s %10s %12s' % ('res', 'chain ms', 'fused ms', 'max abs diff'))
+    for name, shape in RESOLUTIONS.items():
+        image = np.random.randint(0, 255, shape, dtype=np.uint8)
+        expect, expect_info = chain_preprocess(image, ops)
+        actual, actual_info = fused(image)
+        assert tuple(expect_info['resize_shape']) == actual_info['resize_shape']
+        diff = np.abs(expect - actual).max()
+        chain_ms = timeit(lambda: chain_preprocess(image, ops), repeats)
+        fused_ms = timeit(lambda: fused(image), repeats)
+        print('%-6s %10.2f %10.2f %12.2e' % (name, chain_ms, fused_ms, diff))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,113 @@
+"""
+bytes on the wire and latency of one incident upload for every upload
+format, against a local stand-in of the incident server
+usage: python -m benchmarks.upload_benchmark [uploads] [server_delay_ms]
+"""
+import sys
+import time
+import socket
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import cv2
+import numpy as np
+import requests
+
+from tools.detection import DetectionResult
+from tools.image_converter import cv2jpeg
+from tools.incidents import Incidents, create_incident_payload, post_incident
+
+
+MODES = (
+    # name, upload format, gzip json, reuse the connection
+    ('json_base64 new conn', 'json_base64', False, False),
+    ('json_base64', 'json_base64', False, True),
+    ('multipart', 'multipart', False, True),
+    ('multipart gzip', 'multipart', True, True),
+)
+
+
+class _Stats:
+    bytes_num = 0
+    connection_num = 0
+    delay = 0.
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # answer with a single write, a split header / body write stalls
+    # keep-alive connections on nagle and delayed acks
+    wbufsize = 64 * 1024
+
+    def setup(self):
+        super(_Handler, self).setup()
+        _Stats.connection_num += 1
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.rfile.read(length)
+        _Stats.bytes_num += len(self.requestline) + 2 + len(str(self.headers)) + length
+        time.sleep(_Stats.delay)
+        body = b'{"code": 1}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _incident():
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    frame[:] = np.linspace(40, 200, 1920, dtype=np.uint8)[None, :, None]
+    cv2.rectangle(frame, (600, 300), (1300, 900), (90, 120, 160), -1)
+    frame = cv2.add(frame, np.random.randint(0, 12, frame.shape, dtype=np.uint8))
+    result = DetectionResult(np.array([[0, 0.8, 700 + i * 40, 400, 760 + i * 40, 470]
+                                       for i in range(5)], dtype=np.float64))
+    incidents = Incidents().add_detections(result)
+    incidents.add_result('all_count', '堆积混乱总目标数', str(result.num))
+    return cv2jpeg(frame), incidents.get_data()
+
+
+def main(uploads=20, server_delay_ms=0):
+    _Stats.delay = server_delay_ms / 1000.
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = _Server(('127.0.0.1', port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    domain = '127.0.0.1:%d' % port
+    image, result = _incident()
+    print('jpeg: %d bytes' % len(image))
+    print('%-22s %14s %12s %12s' % ('mode', 'bytes / upload', 'mean ms',
+                                    'connections'))
+    for name, upload_format, gzip_json, reuse in MODES:
+        _Stats.bytes_num = _Stats.connection_num = 0
+        session = requests.Session()
+        latencies = []
+        for _ in range(uploads):
+            payload = create_incident_payload(image, result)
+            if not reuse:
+                session.close()
+                session = requests.Session()
+            tic = time.perf_counter()
+            assert post_incident(domain, payload, 10, upload_format,
+                                 gzip_json, session)
+            latencies.append(time.perf_counter() - tic)
+        session.close()
+        print('%-22s %14d %12.2f %12d' % (name, _Stats.bytes_num / uploads,
+                                          np.mean(latencies) * 1000,
+                                          _Stats.connection_num))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
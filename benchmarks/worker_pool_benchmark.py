@@ -0,0 +1,67 @@
+"""
+time from the start of a print job to its first inference, loading the
+detector in the job's own process against an InferenceWorkerPool
+usage: python -m benchmarks.worker_pool_benchmark [job_num]
+
+Runs the backend selected by configs.INFER, so the model files and the
+inference library have to be installed.
+"""
+import sys
+import time
+import multiprocessing as mp
+
+import numpy as np
+
+from infers.load_infer import get_predictor
+from infers.worker_pool import InferenceWorkerPool
+
+
+FRAME_SHAPE = (1080, 1920, 3)
+
+
+def _cold_job(result):
+    tic = time.perf_counter()
+    predictor = get_predictor()
+    predictor.predict(np.zeros(FRAME_SHAPE, dtype=np.uint8))
+    result.put(time.perf_counter() - tic)
+
+
+def _warm_job(pool, result):
+    tic = time.perf_counter()
+    client = pool.client().connect()
+    client.predict(np.zeros(FRAME_SHAPE, dtype=np.uint8))
+    result.put(time.perf_counter() - tic)
+    client.close()
+
+
+def _run_jobs(target, args, job_num):
+    result = mp.Queue()
+    seconds = []
+    for _ in range(job_num):
+        job = mp.Process(target=target, args=args + (result,))
+        job.start()
+        seconds.append(result.get())
+        job.join()
+    return seconds
+
+
+def main(job_num=5):
+    print('%-12s %14s %14s' % ('mode', 'mean ms', 'max ms'))
+    seconds = _run_jobs(_cold_job, (), job_num)
+    print('%-12s %14.1f %14.1f' % ('cold', np.mean(seconds) * 1000,
+                                   np.max(seconds) * 1000))
+    pool = InferenceWorkerPool().start()
+    try:
+        stats = pool.status()['workers'][0]
+        print('pool load: %.1f ms, load to first inference: %.1f ms'
+              % (stats['load_seconds'] * 1000,
+                 stats['first_inference_seconds'] * 1000))
+        seconds = _run_jobs(_warm_job, (pool,), job_num)
+        print('%-12s %14.1f %14.1f' % ('worker pool', np.mean(seconds) * 1000,
+                                       np.max(seconds) * 1000))
+    finally:
+        pool.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
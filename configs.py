@@ -8,8 +8,47 @@ PING_NETWORK = 'www.baidu.com'
 
 # camera address
 CAMERA_FILE = 0
+# only grab() frames in the capture thread and decode the one a
+# consumer asks for, saves the decode cost between inspections
+CAPTURE_DECODE_ON_DEMAND = True
+# pass frames from the detector to the handler through shared memory slots
+# instead of pickling them through an mp.Queue
+SHARED_FRAME_RING = True
+FRAME_RING_SLOTS = 4
+# largest frame (h, w, c) a shared memory slot can hold
+FRAME_RING_MAX_SHAPE = (1080, 1920, 3)
+# 'latest' keeps only the newest unread frames when the handler falls
+# behind, 'fifo' hands every frame over in order
+FRAME_HANDOFF = 'latest'
+# seconds after capture a frame is too old to judge the print on,
+# None to keep every frame
+FRAME_DEADLINE = 120
+# adaptive inspection interval, backs off towards the monitor's
+# inspection_interval while frames are clean and tightens towards
+# min_interval (minutes) when boxes show up
+SCHEDULER = {'enable': True,
+             'min_interval': 0.5,
+             # interval multiplier after a clear inspection
+             'backoff': 2.0,
+             # interval multiplier after a suspicious inspection
+             'tighten': 0.25}
 # infer module path
 INFER = 'infers.paddlelite_infer'
+# long-lived inference workers that load the model once and serve the
+# monitors of every print job over a Unix socket, see infers.worker_pool
+INFER_WORKER_POOL = {'enable': False,
+                     'address': '/tmp/3d-printer-monitor-infer.sock',
+                     'worker_num': 1,
+                     # (h, w, c) of the blank frames the workers warm up on
+                     'warmup_shape': [480, 640, 3],
+                     'warmup_runs': 2,
+                     # seconds a worker collects requests into one
+                     # micro-batch, 0 runs every request on its own
+                     'batch_window': 0.02,
+                     'max_batch': 8,
+                     # seconds a request of a suspicious printer jumps the
+                     # inference queue, bounds the wait of the others
+                     'priority_boost': 30}
 # preprocess params
 IMAGE_PREPROCESS_PARAM = {
     'Resize': {'image_shape': [608, 608],
@@ -25,6 +64,101 @@ IMAGE_PREPROCESS_PARAM = {
     'Permute': {'channel_first': True,
                 'to_bgr': False}
 }
+# capture format negotiated with the camera driver, a key of
+# CAPTURE_PROFILES or None to keep the OpenCV defaults
+CAPTURE_PROFILE = 'match_model_input'
+CAPTURE_PROFILES = {
+    # smallest mode that still covers the model input size
+    'match_model_input': {'fourcc': 'MJPG',
+                          'fps': 15,
+                          'buffer_size': 1,
+                          'cover_size': IMAGE_PREPROCESS_PARAM['Resize']['target_size'],
+                          'resolutions': [(640, 480), (800, 600), (1024, 768),
+                                          (1280, 720), (1280, 960),
+                                          (1920, 1080)]},
+    '1080p_mjpg': {'fourcc': 'MJPG',
+                   'width': 1920,
+                   'height': 1080,
+                   'fps': 15,
+                   'buffer_size': 1},
+}
+# skip inference on frames that barely differ from the last inferred one
+CHANGE_GATE = {'enable': True,
+               # side of the grayscale thumbnail the frames are compared on
+               'size': 64,
+               # mean absolute gray level difference counted as a change
+               'threshold': 4.0,
+               # force inference after this many skips in a row
+               'max_skip': 5}
+# switch the model input size to stay within a per-frame latency budget,
+# goes to the largest size as soon as a suspicious box shows up
+ADAPTIVE_RESOLUTION = {'enable': False,
+                       'sizes': [320, 416, 608],
+                       # seconds a predict call may take
+                       'latency_budget': 2.0,
+                       # step up when the next size is expected to stay
+                       # below headroom * latency_budget
+                       'headroom': 0.8,
+                       # calls the rolling latency is averaged over
+                       'window': 5,
+                       'suspicious_score': 0.3}
+# region of the camera frame the detector looks at, in frame pixels, None
+# for the whole frame, {'rect': [x_min, y_min, x_max, y_max]} for a
+# zero-copy crop or {'polygon': [[x, y], ...]} to black out the rest.
+# A FLEET_PRINTERS entry sets the region of its own camera with 'roi'
+CAMERA_ROI = None
+# run the detector on overlapping full resolution tiles of the frame,
+# trades latency for recall on small defects
+TILED_INFERENCE = {'enable': False,
+                   # side of a tile in frame pixels
+                   'tile_size': 608,
+                   # fraction of a tile shared with its neighbour
+                   'overlap': 0.2,
+                   # tiles grow until the grid and the whole frame tile
+                   # fit in this budget, 7 is a 3x2 grid on 1080p
+                   'max_tiles': 7,
+                   # iou above which boxes from different tiles are merged
+                   'nms_threshold': 0.5,
+                   # also run the whole frame for objects larger than a tile
+                   'include_full_frame': True}
+# two stage cascade, a cheap screener runs on every frame and the full
+# detector only when the screener score reaches threshold
+CASCADE = {'enable': False,
+           # 'low_res' for a low resolution pass of the same model, or the
+           # path of an infer module whose Detector.predict returns a
+           # DetectionResult or a float score
+           'screener': 'low_res',
+           # input size of the low resolution pass
+           'screen_size': 320,
+           'threshold': 0.05}
+# confirm failures from boxes tracked across inspections instead of
+# counting event_num frames with more than failure_num boxes
+TRACKER = {'enable': False,
+           # iou a box needs to continue a track
+           'iou_threshold': 0.3,
+           # inspections a track survives without a box
+           'max_missed': 1,
+           # inspections before a track can be confirmed
+           'min_age': 2,
+           # last area / first area a confirmed track needs
+           'min_growth': 1.0,
+           # mean score over the history a confirmed track needs
+           'min_score': 0.1,
+           'history': 5,
+           # confirmed tracks that shut the printer down
+           'confirm_num': 1}
+# inference runtime, threads used by Paddle Lite / Paddle Inference
+INFER_CPU_THREADS = 3
+# Paddle Lite PowerMode name: LITE_POWER_HIGH, LITE_POWER_LOW,
+# LITE_POWER_FULL, LITE_POWER_NO_BIND, LITE_POWER_RAND_HIGH, LITE_POWER_RAND_LOW
+LITE_POWER_MODE = 'LITE_POWER_NO_BIND'
+# oneDNN kernels for Paddle Inference on x86 CPUs
+ENABLE_MKLDNN = False
+# cpu cores each monitor process and the INFER_WORKER_POOL workers are
+# pinned to, None leaves it to the os
+CPU_AFFINITY = {'detector': [0],
+                'handler': [1, 2, 3],
+                'infer_pool': [1, 2, 3]}
 # the resulting filter threshold
 INFER_THRESHOLD = 0.03
 PREDICT_LABELS = ['failure',]
@@ -46,5 +180,57 @@ SERIAL_TIMEOUT = 3
 # GPIO_POWER_PIN_NUM = 11
 
 
+# printers run together by monitors.FleetSupervisor, every printer gets
+# a LocalMonitor and they share one INFER_WORKER_POOL. camera, controller
+# and roi fall back to CAMERA_FILE, CONTROLLER and CAMERA_ROI, the other
+# keys are LocalMonitor arguments (minutes for all_time and
+# inspection_interval)
+FLEET_PRINTERS = []
+# FLEET_PRINTERS = [
+#     {'name': 'printer-1',
+#      'camera': 0,
+#      'controller': {'class': CONTROLLER, 'port': '/dev/ttyUSB0'},
+#      'all_time': 200,
+#      'inspection_interval': 1,
+#      'failure_num': 2,
+#      'event_num': 1},
+#     {'name': 'printer-2',
+#      'camera': 'rtsp://192.168.1.12/stream',
+#      'controller': {'class': CONTROLLER, 'port': '/dev/ttyUSB1'},
+#      'roi': {'rect': [320, 60, 1600, 1020]},
+#      'all_time': 200,
+#      'inspection_interval': 1,
+#      'failure_num': 2,
+#      'event_num': 1},
+# ]
+# seconds between two status tables of the fleet
+FLEET_STATUS_INTERVAL = 60
+# 'process' runs a detector and a handler process per printer, 'asyncio'
+# runs every printer on one event loop and only offloads preprocessing
+# and inference to an executor, see monitors.AsyncMonitorRuntime
+MONITOR_RUNTIME = 'process'
+
+
 # server configuration
 SERVER_ADRESS = 'aocpo.ahpu.edu.cn'
+# upload incidents from a background thread, incidents that can't be
+# sent right away wait in an append-only spool file on disk
+INCIDENT_UPLOADER = {'enable': True,
+                     'spool_path': os.path.join(BASE_DIR, 'incident_spool',
+                                                'incidents.jsonl'),
+                     # incidents kept in memory before they spill to disk
+                     'queue_size': 16,
+                     # the oldest spooled incidents are evicted beyond this
+                     'max_spool_bytes': 50 * 1024 * 1024,
+                     # (connect, read) seconds of a single upload
+                     'timeout': (3.05, 30),
+                     # retry delay after the first failure, doubled after
+                     # each further failure up to max_backoff
+                     'backoff': 1.0,
+                     'max_backoff': 300.0,
+                     # 'multipart' sends the raw jpeg next to the incident
+                     # json over a keep-alive connection, the server has to
+                     # accept it. 'json_base64' is the original format.
+                     'upload_format': 'json_base64',
+                     # gzip the json part of a multipart upload
+                     'gzip_json': False}
@@ -7,10 +7,16 @@ from monitor_logger.logger import get_logger
 logger = get_logger()
 
 
-def get_controller():
-    controller_module, controller = configs.CONTROLLER.rsplit('.', 1)
+def get_controller(controller=None, **kwargs):
+    """
+    :param controller: class path, configs.CONTROLLER if None
+    :param kwargs: passed on to the controller class, e.g. port
+    """
+    if controller is None:
+        controller = configs.CONTROLLER
+    controller_module, controller = controller.rsplit('.', 1)
     try:
         controller_class = getattr(importlib.import_module(controller_module), controller)
     except (AttributeError, ModuleNotFoundError):
         logger.error('controllers.get_controllers: %s', 'not found class')
-    return controller_class()
+    return controller_class(**kwargs)
@@ -7,8 +7,8 @@ __all__ = ['GPIOController',]
 
 
 class GPIOController:
-    def __init__(self):
-        self.pin_num = configs.GPIO_POWER_PIN_NUM
+    def __init__(self, pin_num=None):
+        self.pin_num = pin_num or configs.GPIO_POWER_PIN_NUM
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BOARD)
         GPIO.setup(self.pin_num, GPIO.OUT)
@@ -8,10 +8,10 @@ __all__ = ['SerialController',]
 
 
 class SerialController:
-    def __init__(self):
-        self.port = configs.SERIAL_PORT
-        self.bps = configs.SERIAL_BAUD_RATE
-        self.timeout = configs.SERIAL_TIMEOUT
+    def __init__(self, port=None, bps=None, timeout=None):
+        self.port = port or configs.SERIAL_PORT
+        self.bps = bps or configs.SERIAL_BAUD_RATE
+        self.timeout = timeout or configs.SERIAL_TIMEOUT
         self.logger = get_logger()
         try:
             self.main_engine = serial.Serial(self.port, self.bps, timeout=self.timeout)
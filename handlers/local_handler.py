@@ -1,25 +1,30 @@
 import configs
 from monitor_logger.logger import get_logger
 from tools import visualize_box_mask
-from tools import Incidents, Label, Location, upload_incident, cv2base64
+from tools import Incidents, upload_incident, cv2jpeg
+from tools import IncidentUploader
 
 logger = get_logger()
 
 
-def local_handler(frame, result):
-    image = cv2base64(frame)
+def create_uploader():
+    """
+    :return: IncidentUploader from configs.INCIDENT_UPLOADER, None if disabled
+    """
+    param = dict(configs.INCIDENT_UPLOADER)
+    if not param.pop('enable'):
+        return None
+    return IncidentUploader(configs.SERVER_ADRESS, **param)
+
+
+def local_handler(frame, result, uploader=None):
+    """
+    report a failure to the incident server
+    :param uploader: IncidentUploader, None uploads synchronously
+    """
+    image = cv2jpeg(frame)
     incidents = Incidents()
-    np_boxes = result['boxes']
-    for box in np_boxes:
-        clsid, bbox, score = int(box[0]), box[2:], box[1]
-        xmin, ymin, xmax, ymax = bbox
-        w = xmax - xmin
-        h = ymax - ymin
-        location = Location(xmin, ymin, w, h)
-        label = Label('failue',
-                      '置信度',
-                      str(score))
-        incidents.add_incident(location, label)
+    incidents.add_detections(result)
     incidents.add_result('all_count',
                          '堆积混乱总目标数',
                          str(result['num']),
@@ -32,4 +37,9 @@ def local_handler(frame, result):
                          '是否成功关闭',
                          '是',
                          {'color': 'red', 'font-size': '15px'})
-    upload_incident(domain=configs.SERVER_ADRESS, incident_image=image, result=incidents.get_data())
\ No newline at end of file
+    if uploader is not None:
+        uploader.submit(image, incidents.get_data())
+        return
+    upload_incident(domain=configs.SERVER_ADRESS, incident_image=image, result=incidents.get_data(),
+                    upload_format=configs.INCIDENT_UPLOADER['upload_format'],
+                    gzip_json=configs.INCIDENT_UPLOADER['gzip_json'])
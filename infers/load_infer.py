@@ -2,16 +2,63 @@ import importlib
 
 import configs
 from monitor_logger.logger import get_logger
+from tools import AdaptiveResolution, TiledDetector, RegionOfInterest, ROIDetector
+from tools import CascadeDetector, LowResScreener
 
 logger = get_logger()
 
 
-def get_infer():
+def get_infer(module_path=None):
+    if module_path is None:
+        module_path = configs.INFER
     try:
-        module = importlib.import_module(configs.INFER)
+        module = importlib.import_module(module_path)
     except Exception:
         logger.error('infers.load_infer.get_infer: %s',
                      'The Infer parameter can only be paddle_inference_infer'
                      ' or paddlelite_infer!')
         return
-    return importlib.import_module(configs.INFER)
+    return module
+
+
+def _enabled_params(param):
+    param = dict(param)
+    return param.pop('enable'), param
+
+
+def get_predictor(roi=None):
+    """
+    build the configured detector stack around the infer module Detector:
+    adaptive resolution, tiling, region of interest and cascade
+    :param roi: RegionOfInterest kwargs, None for configs.CAMERA_ROI and
+                {} for the whole frame
+    :return: object with predict(frame), None if the infer module is missing
+    """
+    if roi is None:
+        roi = configs.CAMERA_ROI
+    infer = get_infer()
+    if not infer:
+        return
+    detector = infer.Detector()
+    predictor = detector
+    enable, param = _enabled_params(configs.ADAPTIVE_RESOLUTION)
+    if enable:
+        predictor = AdaptiveResolution(predictor, **param)
+    enable, param = _enabled_params(configs.TILED_INFERENCE)
+    if enable:
+        predictor = TiledDetector(predictor, **param)
+    if roi:
+        predictor = ROIDetector(predictor, RegionOfInterest(**roi))
+    enable, param = _enabled_params(configs.CASCADE)
+    if enable:
+        if param['screener'] == 'low_res':
+            screener = LowResScreener(detector, param['screen_size'])
+        else:
+            screener_infer = get_infer(param['screener'])
+            if not screener_infer:
+                return
+            screener = screener_infer.Detector()
+        if roi:
+            screener = ROIDetector(screener, RegionOfInterest(**roi))
+        predictor = CascadeDetector(predictor, screener, param['threshold'])
+    return predictor
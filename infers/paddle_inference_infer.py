@@ -6,7 +6,12 @@ import numpy as np
 import paddle.fluid as fluid
 
 from tools.preprocess import *
+from tools.detection import DetectionResult
 import configs
+from monitor_logger.logger import get_logger
+
+
+logger = get_logger()
 
 
 def decode_image(im_file, im_info):
@@ -111,11 +116,14 @@ class Config:
 def load_predictor(run_mode='fluid',
                    batch_size=1,
                    use_gpu=False,
-                   min_subgraph_size=3):
+                   min_subgraph_size=3,
+                   cpu_threads=configs.INFER_CPU_THREADS,
+                   enable_mkldnn=configs.ENABLE_MKLDNN):
     """set AnalysisConfig, generate AnalysisPredictor
     Args:
-        model_dir (str): root path of __model__ and __params__
         use_gpu (bool): whether use gpu
+        cpu_threads (int): cpu math library threads
+        enable_mkldnn (bool): whether use oneDNN kernels on cpu
     Returns:
         predictor (PaddlePredictor): AnalysisPredictor
     Raises:
@@ -143,6 +151,12 @@ def load_predictor(run_mode='fluid',
         config.switch_ir_optim(True)
     else:
         config.disable_gpu()
+        config.set_cpu_math_library_num_threads(cpu_threads)
+        if enable_mkldnn:
+            config.enable_mkldnn()
+    logger.info('paddle_inference_infer.load_predictor: %s',
+                'use_gpu: %s cpu threads: %d mkldnn: %s'
+                % (use_gpu, cpu_threads, enable_mkldnn))
 
     if run_mode in precision_map.keys():
         config.enable_tensorrt_engine(
@@ -185,7 +199,7 @@ class Detector:
     """
 
     def __init__(self,
-                 model_dir,
+                 model_dir=configs.PADDLE_INFERENCE_MODEL_DIR,
                  use_gpu=False,
                  run_mode='fluid',
                  threshold=0.5):
@@ -195,54 +209,61 @@ class Detector:
                 model_dir, use_gpu=use_gpu)
         else:
             self.predictor = load_predictor(
-                model_dir,
                 run_mode=run_mode,
                 min_subgraph_size=self.config.min_subgraph_size,
                 use_gpu=use_gpu)
-        self.preprocess_ops = []
-        for op_info in self.config.preprocess_infos:
-            op_type = op_info.pop('type')
-            if op_type == 'Resize':
-                op_info['arch'] = self.config.arch
-            self.preprocess_ops.append(eval(op_type)(**op_info))
+        # frames read by cv2 are fed to the model as they are
+        self.base_preprocess_pipeline = PreprocessPipeline(
+            self.config.preprocess_infos, self.config.arch, from_bgr=False)
+        self.preprocess_pipeline = self.base_preprocess_pipeline
+        self.input_size = next((op_info['target_size']
+                                for op_info in self.config.preprocess_infos
+                                if op_info['type'] == 'Resize'), None)
+
+    def set_input_size(self, size):
+        """
+        Args:
+            size (int): Resize target size, a multiple of 32 for YOLO
+        """
+        self.preprocess_pipeline = \
+            self.base_preprocess_pipeline.for_target_size(size)
+        self.input_size = size
 
     def preprocess(self, im):
-        # process image by preprocess_ops
+        if not isinstance(im, str):
+            im, im_info = self.preprocess_pipeline(im)
+            inputs = create_inputs(im, im_info, self.config.arch)
+            return inputs, im_info
+        # process image file by preprocess_ops
         im_info = {
             'scale': [1., 1.],
             'origin_shape': None,
             'resize_shape': None,
         }
         im, im_info = decode_image(im, im_info)
-        for operator in self.preprocess_ops:
-            im, im_info = operator(im, im_info)
+        im, im_info = self.preprocess_pipeline.apply_ops(im, im_info)
         im = np.array((im, )).astype('float32')
         inputs = create_inputs(im, im_info, self.config.arch)
         return inputs, im_info
 
+    def preprocess_batch(self, ims):
+        im, im_infos = self.preprocess_pipeline.batch(ims)
+        per_image = [create_inputs(im[i:i + 1], im_info, self.config.arch)
+                     for i, im_info in enumerate(im_infos)]
+        inputs = {name: np.concatenate([item[name] for item in per_image])
+                  for name in per_image[0] if name != 'image'}
+        inputs['image'] = im
+        return inputs, im_infos
+
     def postprocess(self, np_boxes, np_masks, im_info, threshold=0.5):
         # postprocess output of predictor
-        results = {}
         if self.config.arch in ['SSD', 'Face']:
             w, h = im_info['origin_shape']
             np_boxes[:, 2] *= h
             np_boxes[:, 3] *= w
             np_boxes[:, 4] *= h
             np_boxes[:, 5] *= w
-        expect_boxes = (np_boxes[:, 1] > threshold) & (np_boxes[:, 0] > -1)
-        np_boxes = np_boxes[expect_boxes, :]
-        def handle_round(box):
-            new_box = [int(box[0]), round(box[1], 4),
-                       round(box[2], 2), round(box[3], 2),
-                       round(box[4], 2), round(box[5], 2)]
-            return new_box
-        np_boxes = list(map(handle_round, np_boxes))
-        results['boxes'] = np_boxes
-        results['num'] = len(np_boxes)
-        if np_masks is not None:
-            np_masks = np_masks[expect_boxes, :, :, :]
-            results['masks'] = np_masks
-        return results
+        return DetectionResult.from_output(np_boxes, threshold, np_masks)
 
     def predict(self,
                 image,
@@ -255,7 +276,7 @@ class Detector:
             image (str/np.ndarray): path of image/ np.ndarray read by cv2
             threshold (float): threshold of predicted box' score
         Returns:
-            results (dict): include 'boxes': np.ndarray: shape:[N,6], N: number of box,
+            results (DetectionResult): include 'boxes': np.ndarray: shape:[N,6], N: number of box,
                             matix element:[class, score, x_min, y_min, x_max, y_max]
                             MaskRCNN's results include 'masks': np.ndarray:
                             shape:[N, class_num, mask_resolution, mask_resolution]
@@ -307,9 +328,49 @@ class Detector:
         results = []
         if not run_benchmark:
             if reduce(lambda x, y: x * y, np_boxes.shape) < 6:
-                results = {'boxes': np.array([]), 'num': 0}
+                results = DetectionResult()
             else:
                 results = self.postprocess(
                     np_boxes, np_masks, im_info, threshold=threshold)
 
         return results
+
+    def predict_batch(self, images, threshold=configs.INFER_THRESHOLD):
+        """
+        Args:
+            images (list): np.ndarray frames read by cv2
+            threshold (float): threshold of predicted box' score
+        Returns:
+            results (list): DetectionResult of each image
+        """
+        inputs, im_infos = self.preprocess_batch(images)
+        np_masks = None
+        if self.config.use_python_inference:
+            outs = self.executor.run(self.program,
+                                     feed=inputs,
+                                     fetch_list=self.fecth_targets,
+                                     return_numpy=False)
+            lod = outs[0].lod()
+            np_boxes = np.array(outs[0])
+            if self.config.mask_resolution is not None:
+                np_masks = np.array(outs[1])
+        else:
+            for name in self.predictor.get_input_names():
+                self.predictor.get_input_tensor(name).copy_from_cpu(inputs[name])
+            self.predictor.zero_copy_run()
+            output_names = self.predictor.get_output_names()
+            boxes_tensor = self.predictor.get_output_tensor(output_names[0])
+            lod = boxes_tensor.lod()
+            np_boxes = boxes_tensor.copy_to_cpu()
+            if self.config.mask_resolution is not None:
+                np_masks = self.predictor.get_output_tensor(
+                    output_names[1]).copy_to_cpu()
+        if self.config.arch in ['SSD', 'Face'] and np_boxes.size >= 6:
+            # SSD boxes are normalized, scale them by their own image
+            batch_index = np.repeat(np.arange(len(images)), np.diff(lod[0]))
+            origin_shapes = np.array([im_info['origin_shape']
+                                      for im_info in im_infos])[batch_index]
+            np_boxes[:, [2, 4]] *= origin_shapes[:, 1:2]
+            np_boxes[:, [3, 5]] *= origin_shapes[:, 0:1]
+        return DetectionResult.split_batch(np_boxes, lod, len(images),
+                                           threshold, np_masks)
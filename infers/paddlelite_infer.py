@@ -1,3 +1,4 @@
+import time
 from functools import reduce
 
 import cv2
@@ -5,15 +6,42 @@ import numpy as np
 from paddlelite.lite import *
 
 import configs
-from tools.preprocess import Resize, Permute, Normalize
+from monitor_logger.logger import get_logger
+from tools.preprocess import PreprocessPipeline
+from tools.detection import DetectionResult
+
+
+logger = get_logger()
 
 
 class Detector:
+    STAGES = ('preprocess', 'feed', 'run', 'fetch', 'postprocess')
+
     def __init__(self):
         config = MobileConfig()
         config.set_model_from_file(configs.PADDLELITE_MODEL)  # load yolov3 model
+        config.set_threads(configs.INFER_CPU_THREADS)
+        config.set_power_mode(getattr(PowerMode, configs.LITE_POWER_MODE))
+        logger.info('paddlelite_infer.Detector: %s',
+                    'threads: %d power mode: %s' % (configs.INFER_CPU_THREADS,
+                                                    configs.LITE_POWER_MODE))
         self._predictor = create_paddle_predictor(config)
         self.preprocess_param = configs.IMAGE_PREPROCESS_PARAM
+        self._base_preprocess = PreprocessPipeline(self.preprocess_param)
+        self._preprocess = self._base_preprocess
+        self.input_size = self.preprocess_param['Resize']['target_size']
+        # newer Paddle Lite tensors take and return numpy arrays directly
+        self._numpy_io = hasattr(self._predictor.get_input(0), 'from_numpy')
+        # seconds spent in each stage of the last predict call
+        self.last_timings = {}
+
+    def set_input_size(self, size):
+        """
+        switch the model input resolution
+        :param size: Resize target size, a multiple of 32 for yolov3
+        """
+        self._preprocess = self._base_preprocess.for_target_size(size)
+        self.input_size = size
 
     def _decode_image(self, image):
         """
@@ -21,20 +49,7 @@ class Detector:
         :param image: ndarray
         :return: ndarray, dict
         """
-        im_info = {
-            'scale': [1., 1.],
-            'origin_shape': None,
-            'resize_shape': None,
-        }
-        im = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        im_info['origin_shape'] = im.shape[:2]
-        im_info['resize_shape'] = im.shape[:2]
-        preprocess_ops = [eval(op_type)(**op_info)
-                          for op_type, op_info in self.preprocess_param.items()]
-        for operator in preprocess_ops:
-            im, im_info = operator(im, im_info)
-        im = np.array((im,)).astype('float32')
-        return im, im_info
+        return self._preprocess(image)
 
     @staticmethod
     def _create_inputs(im, im_info):
@@ -60,20 +75,9 @@ class Detector:
         :param np_boxes: yolov3 output
         :param im_info: dict
         :param threshold: threshold
-        :return: dict
-        """
-        results = {}
-        expect_boxes = (np_boxes[:, 1] > threshold) & (np_boxes[:, 0] > -1)
-        np_boxes = np_boxes[expect_boxes, :]
-        def handle_round(box):
-            new_box = [int(box[0]), round(box[1], 4),
-                       round(box[2], 2), round(box[3], 2),
-                       round(box[4], 2), round(box[5], 2)]
-            return new_box
-        np_boxes = list(map(handle_round, np_boxes))
-        results['boxes'] = np_boxes
-        results['num'] = len(np_boxes)
-        return results
+        :return: DetectionResult
+        """
+        return DetectionResult.from_output(np_boxes, threshold)
 
     def predict(self,
                 image,
@@ -84,30 +88,70 @@ class Detector:
         :param threshold: threshold
         :return: result
         """
+        stamps = [time.perf_counter()]
         im, im_info = self._decode_image(image)
         inputs = self._create_inputs(im, im_info)
-        input_tensor_image = self._predictor.get_input(0)
-        input_tensor_image.resize([1, 3,
-                                   im_info['resize_shape'][0],
-                                   im_info['resize_shape'][1]])
-        image_data = inputs['image'].flatten().tolist()
-        input_tensor_image.set_float_data(image_data)
-
-        input_tensor_size = self._predictor.get_input(1)
-        input_tensor_size.resize([1, 2])
-        size_data = inputs['im_size'].flatten().tolist()
-        input_tensor_size.set_int32_data(size_data)
+        stamps.append(time.perf_counter())
+        self._feed_inputs(inputs)
+        stamps.append(time.perf_counter())
+        self._predictor.run()
+        stamps.append(time.perf_counter())
+        np_boxes = self._fetch_boxes()
+        stamps.append(time.perf_counter())
+        if np_boxes is None or reduce(lambda x, y: x * y, np_boxes.shape) < 6:
+            results = DetectionResult()
+        else:
+            results = self._postprocess(np_boxes, im_info, threshold)
+        stamps.append(time.perf_counter())
+        self.last_timings = dict(zip(self.STAGES, np.diff(stamps).tolist()))
+        return results
 
+    def predict_batch(self,
+                      images,
+                      threshold=configs.INFER_THRESHOLD):
+        """
+        predict several images with a single forward pass
+        :param images: list of ndarray
+        :param threshold: threshold
+        :return: list of DetectionResult, one per image
+        """
+        im, im_infos = self._preprocess.batch(images)
+        im_size = np.array([im_info['origin_shape'] for im_info in im_infos],
+                           dtype=np.int32)
+        self._feed_inputs({'image': im, 'im_size': im_size})
         self._predictor.run()
+        np_boxes = self._fetch_boxes()
+        lod = self._predictor.get_output(0).lod()
+        return DetectionResult.split_batch(np_boxes, lod, len(images), threshold)
 
-        np_boxes = self._predictor.get_output(0).float_data()
+    def _feed_inputs(self, inputs):
+        """
+        copy the model inputs into the predictor input tensors
+        :param inputs: dict, see _create_inputs
+        """
+        input_tensor_image = self._predictor.get_input(0)
+        input_tensor_image.resize(list(inputs['image'].shape))
+        input_tensor_size = self._predictor.get_input(1)
+        input_tensor_size.resize(list(inputs['im_size'].shape))
+        if self._numpy_io:
+            input_tensor_image.from_numpy(
+                np.ascontiguousarray(inputs['image'], dtype=np.float32))
+            input_tensor_size.from_numpy(
+                np.ascontiguousarray(inputs['im_size'], dtype=np.int32))
+        else:
+            input_tensor_image.set_float_data(inputs['image'].flatten().tolist())
+            input_tensor_size.set_int32_data(inputs['im_size'].flatten().tolist())
 
-        try:
-            np_boxes = np.array(np_boxes).reshape(-1, 6)
-        except Exception:
-            return {'boxes': np.array([]), 'num': 0}
-        if reduce(lambda x, y: x * y, np_boxes.shape) < 6:
-            results = {'boxes': np.array([]), 'num': 0}
+    def _fetch_boxes(self):
+        """
+        :return: [N, 6] float64 ndarray, None when the output is malformed
+        """
+        output_tensor = self._predictor.get_output(0)
+        if self._numpy_io:
+            np_boxes = output_tensor.numpy()
         else:
-            results = self._postprocess(np_boxes, im_info, threshold)
-        return results
+            np_boxes = output_tensor.float_data()
+        try:
+            return np.asarray(np_boxes, dtype=np.float64).reshape(-1, 6)
+        except ValueError:
+            return None
@@ -0,0 +1,397 @@
+import os
+import time
+import queue
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+import configs
+from monitor_logger.logger import get_logger
+from tools import RegionOfInterest
+from .load_infer import get_predictor
+
+logger = get_logger()
+
+
+__all__ = ['InferenceWorkerPool', 'InferenceClient',]
+
+
+def send_frame(connection, frame, priority=0):
+    """send the raw pixels after a small header, no pickling of the array"""
+    frame = np.ascontiguousarray(frame)
+    connection.send((frame.shape, frame.dtype.str, priority))
+    connection.send_bytes(frame.reshape(-1))
+
+
+def recv_frame(connection):
+    """
+    :return: (read-only ndarray backed by the received bytes, priority)
+    """
+    shape, dtype, priority = connection.recv()
+    frame = np.frombuffer(connection.recv_bytes(), dtype=dtype).reshape(shape)
+    return frame, priority
+
+
+class InferenceWorkerPool:
+    """
+    long-lived inference worker processes that load and warm up the
+    detector stack once and outlive the monitors of single print jobs.
+    Monitors submit frames over a Unix socket through InferenceClient,
+    every connection is served by one worker. With worker_num=1 and a
+    batch_window the pool is a shared inference server: any number of
+    monitors use one copy of the model and requests that arrive within
+    the window are run as one predict_batch call. The workers see whole
+    frames, every client crops its own camera's region of interest.
+    Args:
+        address (str): path of the Unix socket
+        worker_num (int): number of worker processes
+        warmup_shape (list): (h, w, c) of the blank warm-up frames
+        warmup_runs (int): predict calls before a worker reports ready
+        batch_window (float): seconds a worker waits for more requests
+                              after the first one, 0 disables batching
+        max_batch (int): largest micro-batch
+        priority_boost (float): seconds a request jumps the queue per
+                                priority level, e.g. frames of a printer
+                                that looked suspicious. Bounded so that
+                                clear printers are never starved.
+    """
+
+    def __init__(self,
+                 address=configs.INFER_WORKER_POOL['address'],
+                 worker_num=configs.INFER_WORKER_POOL['worker_num'],
+                 warmup_shape=configs.INFER_WORKER_POOL['warmup_shape'],
+                 warmup_runs=configs.INFER_WORKER_POOL['warmup_runs'],
+                 batch_window=configs.INFER_WORKER_POOL['batch_window'],
+                 max_batch=configs.INFER_WORKER_POOL['max_batch'],
+                 priority_boost=configs.INFER_WORKER_POOL['priority_boost']):
+        self.address = address
+        self.worker_num = worker_num
+        self.warmup_shape = tuple(warmup_shape)
+        self.warmup_runs = max(warmup_runs, 1)
+        self.batch_window = batch_window
+        self.max_batch = max(max_batch, 1)
+        self.priority_boost = priority_boost
+        self._listener = None
+        self._workers = []
+        self._stop_event = mp.Event()
+        self._ready = mp.Queue()
+        self._served = [mp.Value('i', 0) for _ in range(worker_num)]
+        self._batches = [mp.Value('i', 0) for _ in range(worker_num)]
+        self._worker_stats = {}
+        # clients connected to this worker, only used inside the worker
+        self._connection_num = 0
+        self._connection_lock = threading.Lock()
+        # tie breaker of the request priority queue
+        self._request_ids = itertools.count()
+
+    def start(self, timeout=120.0):
+        """
+        fork the workers and wait until each of them loaded the model
+        :param timeout: seconds the workers get to load and warm up
+        :return: self
+        :raise RuntimeError: a worker could not load the model, died or
+                             was not ready in time
+        """
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family='AF_UNIX')
+        self._stop_event.clear()
+        for index in range(self.worker_num):
+            worker = mp.Process(target=self._serve, args=(index,))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        deadline = time.monotonic() + timeout
+        while len(self._worker_stats) < self.worker_num:
+            try:
+                stats = self._ready.get(timeout=0.5)
+            except queue.Empty:
+                self._check_workers(deadline)
+                continue
+            self._worker_stats[stats['worker']] = stats
+            if stats.get('error'):
+                self.stop()
+                raise RuntimeError('inference worker %d: %s'
+                                   % (stats['worker'], stats['error']))
+            logger.info('InferenceWorkerPool.start: %s',
+                        'worker %(worker)d pid: %(pid)d load: %(load_seconds).3fs'
+                        ' first inference: %(first_inference_seconds).3fs'
+                        ' after load start, warm-up: %(warmup_seconds).3fs'
+                        % stats)
+        return self
+
+    def _check_workers(self, deadline):
+        """raise if a worker that is not ready yet died or ran out of time"""
+        for index, worker in enumerate(self._workers):
+            if index in self._worker_stats:
+                continue
+            if not worker.is_alive():
+                error = 'exited with code %s before it was ready' % worker.exitcode
+            elif time.monotonic() >= deadline:
+                error = 'not ready in time'
+            else:
+                continue
+            self.stop()
+            raise RuntimeError('inference worker %d: %s' % (index, error))
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self._workers = []
+        if self._listener is not None:
+            # also removes the socket file
+            self._listener.close()
+            self._listener = None
+
+    def client(self, roi=None):
+        """called in the monitor process, see InferenceClient"""
+        return InferenceClient(self.address, roi)
+
+    def status(self):
+        """
+        :return: dict, per worker pid, liveness, requests served, inference
+                 calls run and the load, warm-up and load-to-first-inference
+                 times
+        """
+        workers = {}
+        for index, worker in enumerate(self._workers):
+            workers[index] = dict(self._worker_stats.get(index, {}),
+                                  alive=worker.is_alive(),
+                                  served=self._served[index].value,
+                                  batches=self._batches[index].value)
+        return {'address': self.address, 'workers': workers}
+
+    def _set_affinity(self):
+        """the workers run the handlers' inference, keep them off the detector cores"""
+        cpus = (configs.CPU_AFFINITY or {}).get('infer_pool')
+        if cpus and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError as e:
+                logger.error('InferenceWorkerPool._set_affinity: %s', e.__str__())
+
+    def _serve(self, index):
+        self._set_affinity()
+        tic = time.perf_counter()
+        try:
+            # regions of interest differ per camera, clients crop them
+            predictor = get_predictor(roi={})
+            if predictor is None:
+                self._ready.put({'worker': index, 'error': 'no infer module'})
+                return
+            load_seconds = time.perf_counter() - tic
+            frame = np.zeros(self.warmup_shape, dtype=np.uint8)
+            predictor.predict(frame)
+            first_inference_seconds = time.perf_counter() - tic
+            for _ in range(self.warmup_runs - 1):
+                predictor.predict(frame)
+        except Exception as e:
+            logger.error('InferenceWorkerPool._serve: %s', e.__str__())
+            self._ready.put({'worker': index, 'error': e.__str__()})
+            return
+        self._ready.put({'worker': index,
+                         'pid': os.getpid(),
+                         'load_seconds': load_seconds,
+                         'first_inference_seconds': first_inference_seconds,
+                         'warmup_seconds': time.perf_counter() - tic - load_seconds})
+        requests = queue.PriorityQueue()
+        batcher = threading.Thread(target=self._batch,
+                                   args=(index, predictor, requests))
+        batcher.daemon = True
+        batcher.start()
+        accepter = threading.Thread(target=self._accept,
+                                    args=(index, requests))
+        accepter.daemon = True
+        accepter.start()
+        self._stop_event.wait()
+
+    def _submit(self, requests, frame, priority=0):
+        """
+        hand a frame to the batcher thread and wait for its result. Requests
+        are served in arrival order, a priority request is served as if it
+        had arrived priority * priority_boost seconds earlier.
+        :return: (DetectionResult, seconds the request waited in the queue)
+        """
+        reply = queue.Queue(1)
+        arrival = time.monotonic()
+        requests.put((arrival - priority * self.priority_boost,
+                      next(self._request_ids), arrival, frame, reply))
+        result, queue_seconds = reply.get()
+        if isinstance(result, Exception):
+            raise result
+        return result, queue_seconds
+
+    def _batch(self, index, predictor, requests):
+        """
+        collect the requests that arrive within batch_window of the first
+        one and run them as a single micro-batch
+        """
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.batch_window
+            # a connection has at most one request in flight, no need to
+            # wait once every connected monitor is in the batch
+            while len(batch) < min(self.max_batch, self._connection_num):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            _, _, arrivals, frames, replies = zip(*batch)
+            started = time.monotonic()
+            with self._batches[index].get_lock():
+                self._batches[index].value += 1
+            try:
+                if len(frames) == 1:
+                    results = [predictor.predict(frames[0])]
+                elif hasattr(predictor, 'predict_batch'):
+                    results = predictor.predict_batch(list(frames))
+                else:
+                    results = [predictor.predict(frame) for frame in frames]
+            except Exception as e:
+                results = [e] * len(frames)
+            for reply, result, arrival in zip(replies, results, arrivals):
+                reply.put((result, started - arrival))
+
+    def _accept(self, index, requests):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError as e:
+                logger.error('InferenceWorkerPool._accept: %s', e.__str__())
+                return
+            handler = threading.Thread(target=self._handle,
+                                       args=(index, requests, connection))
+            handler.daemon = True
+            handler.start()
+
+    def _handle(self, index, requests, connection):
+        """serve one client connection until it is closed"""
+        try:
+            # tells the client a live worker took the connection
+            connection.send(os.getpid())
+        except OSError:
+            connection.close()
+            return
+        with self._connection_lock:
+            self._connection_num += 1
+        try:
+            self._serve_connection(index, requests, connection)
+        finally:
+            with self._connection_lock:
+                self._connection_num -= 1
+
+    def _serve_connection(self, index, requests, connection):
+        with connection:
+            while True:
+                try:
+                    frame, priority = recv_frame(connection)
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok',) + self._submit(requests, frame, priority)
+                except Exception as e:
+                    logger.error('InferenceWorkerPool._serve_connection: %s', e.__str__())
+                    reply = ('error', e.__str__(), 0.)
+                with self._served[index].get_lock():
+                    self._served[index].value += 1
+                try:
+                    connection.send(reply)
+                except OSError:
+                    return
+
+
+class InferenceClient:
+    """
+    predictor facade that sends frames to an InferenceWorkerPool. The pool
+    process keeps the socket open after its workers died, so a connection
+    only counts once a worker acknowledged it.
+    Args:
+        address (str): path of the pool's Unix socket
+        roi (dict): RegionOfInterest kwargs of this client's camera, only
+                    the crop is sent and results come back in frame
+                    coordinates. None or {} sends the whole frame.
+    """
+    # seconds a worker has to acknowledge a new connection
+    CONNECT_TIMEOUT = 5.0
+
+    def __init__(self, address, roi=None):
+        self.address = address
+        self.roi = RegionOfInterest(**roi) if roi else None
+        self._connection = None
+        self.worker_pid = None
+        # seconds the last request waited for the worker
+        self.last_queue_seconds = None
+
+    def connect(self):
+        """
+        :raise ConnectionError: no worker acknowledged the connection
+        """
+        if self._connection is None:
+            try:
+                connection = Client(self.address, family='AF_UNIX')
+            except OSError as e:
+                raise ConnectionError('inference pool at %s: %r'
+                                      % (self.address, e))
+            try:
+                if not connection.poll(self.CONNECT_TIMEOUT):
+                    raise ConnectionError('no inference worker accepted the'
+                                          ' connection to %s' % self.address)
+                self.worker_pid = connection.recv()
+            except EOFError:
+                connection.close()
+                raise ConnectionError('inference worker closed the'
+                                      ' connection to %s' % self.address)
+            except OSError:
+                connection.close()
+                raise
+            self._connection = connection
+        return self
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _request(self, image, priority):
+        send_frame(self.connect()._connection, image, priority)
+        return self._connection.recv()
+
+    def predict(self, image, priority=0):
+        """
+        :param image: ndarray
+        :param priority: int, higher priorities are served first, see
+                         InferenceWorkerPool priority_boost
+        :return: DetectionResult
+        :raise RuntimeError: inference failed in the worker
+        :raise ConnectionError: no worker is reachable, also after a retry
+        """
+        offset = None
+        if self.roi is not None:
+            image, offset = self.roi.crop(image)
+        try:
+            status, reply, queue_seconds = self._request(image, priority)
+        except (EOFError, OSError):
+            # the worker went away, one retry on a fresh connection
+            self.close()
+            try:
+                status, reply, queue_seconds = self._request(image, priority)
+            except (EOFError, OSError) as e:
+                self.close()
+                raise ConnectionError('inference worker: %r' % e)
+        if status != 'ok':
+            raise RuntimeError('inference worker: %s' % reply)
+        self.last_queue_seconds = queue_seconds
+        if offset is not None:
+            return self.roi.to_frame(reply, offset)
+        return reply
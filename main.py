@@ -1,6 +1,25 @@
 from uuid import uuid4
 
-from monitors import LocalMonitor
+import configs
+from monitors import LocalMonitor, FleetSupervisor
+from monitors import AsyncLocalMonitor, AsyncMonitorRuntime
+from infers.worker_pool import InferenceWorkerPool
 
-monitor = LocalMonitor(uuid4(), 200, 1, event_num=1, failure_num=2)
-ld, lh = monitor.run()
+infer_pool = None
+if configs.INFER_WORKER_POOL['enable']:
+    infer_pool = InferenceWorkerPool().start()
+
+if configs.MONITOR_RUNTIME == 'asyncio':
+    printers = configs.FLEET_PRINTERS or [{'all_time': 200,
+                                           'inspection_interval': 1,
+                                           'event_num': 1,
+                                           'failure_num': 2}]
+    AsyncMonitorRuntime([AsyncLocalMonitor(uuid4(), **printer)
+                         for printer in printers], infer_pool).run()
+elif configs.FLEET_PRINTERS:
+    supervisor = FleetSupervisor(configs.FLEET_PRINTERS, infer_pool).start()
+    supervisor.watch(configs.FLEET_STATUS_INTERVAL)
+else:
+    monitor = LocalMonitor(uuid4(), 200, 1, event_num=1, failure_num=2,
+                           infer_pool=infer_pool)
+    ld, lh = monitor.run()
@@ -1,2 +1,4 @@
 from .local_monitor import *
 from .online_monitor import *
+from .fleet import *
+from .async_monitor import *
@@ -0,0 +1,260 @@
+import time
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import configs
+from monitor_logger.logger import get_logger
+from controllers import get_controller
+from infers.load_infer import get_predictor
+from infers.worker_pool import InferenceClient
+from handlers import local_handler, create_uploader
+from tools import GoodVideoCpature, RegionOfInterest, ROIDetector
+from tools import HINT_CLEAR
+from .monitors import create_scheduler
+from .decisions import FailureJudge, create_change_gate
+
+logger = get_logger()
+
+
+__all__ = ['AsyncLocalMonitor', 'AsyncMonitorRuntime',]
+
+
+class AsyncLocalMonitor:
+    """
+    LocalMonitor for the asyncio runtime. One coroutine per printer drives
+    the capture schedule, the failure decision, the incident upload and
+    the controller commands. Frame waits run on a thread of the monitor's
+    own, so a stalled camera never holds up the upload and serial calls of
+    the other printers in the loop's default thread pool. Preprocessing
+    and inference run in the inference executor of the runtime.
+    Args are the ones of LocalMonitor, name only tags the log lines.
+    """
+
+    def __init__(self,
+                 uuid,
+                 all_time,
+                 inspection_interval=10,
+                 failure_num=5,
+                 event_num=5,
+                 camera=None,
+                 controller=None,
+                 roi=None,
+                 name=None):
+        self.uuid = uuid
+        self.all_time = all_time * 60
+        self.inspection_interval = inspection_interval * 60
+        self.failure_num = failure_num
+        self.event_num = event_num
+        self.camera = configs.CAMERA_FILE if camera is None else camera
+        self.controller = controller
+        self.roi = configs.CAMERA_ROI if roi is None else roi
+        self.name = str(uuid) if name is None else name
+        self.frame_num = 0
+        self.last_hint = HINT_CLEAR
+        self.last_inference_at = None
+        self.last_inference_seconds = None
+        self.failed = False
+        self._loop = None
+        self._stop_event = None
+        self._capture = None
+        self._frame_executor = None
+
+    def stop(self):
+        """thread safe, ends run() at the next await"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._request_stop)
+
+    def _request_stop(self):
+        self._stop_event.set()
+        if self._capture is not None:
+            self._capture.interrupt()
+
+    def _create_controller(self):
+        controller = dict(self.controller or {})
+        return get_controller(controller.pop('class', None), **controller)
+
+    def _open_capture(self):
+        capture = GoodVideoCpature.create(
+            self.camera,
+            decode_on_demand=configs.CAPTURE_DECODE_ON_DEMAND,
+            profile=configs.CAPTURE_PROFILES.get(configs.CAPTURE_PROFILE))
+        capture.start_read()
+        if not capture.is_started():
+            capture.stop_read()
+            capture.release()
+            return None
+        return capture
+
+    def _close_capture(self, capture):
+        capture.stop_read()
+        capture.release()
+
+    async def run(self, predictor, executor, uploader=None):
+        """
+        never raises, an error of this printer is logged and ends only
+        this monitor
+        :param predictor: object with predict(frame), see infers.load_infer
+        :param executor: executor the predict calls run in
+        :param uploader: IncidentUploader, None uploads synchronously
+        """
+        loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._stop_event = asyncio.Event()
+        controller = None
+        capture = None
+        self._frame_executor = ThreadPoolExecutor(1)
+        try:
+            controller = await loop.run_in_executor(None, self._create_controller)
+            await loop.run_in_executor(None, controller.boot)
+            capture = await loop.run_in_executor(None, self._open_capture)
+            if capture is None:
+                logger.error('AsyncLocalMonitor.run: %s',
+                             '%s can\'t turn on the camera' % self.name)
+                return
+            self._capture = capture
+            logger.info('AsyncLocalMonitor.run: %s',
+                        '%s start monitor...' % self.name)
+            await self._inspect(loop, capture, controller, predictor, executor,
+                                uploader)
+        except Exception as e:
+            logger.error('AsyncLocalMonitor.run: %s',
+                         '%s stopped on error: %r' % (self.name, e))
+        finally:
+            self._capture = None
+            await self._release(loop, capture, controller)
+            # the capture is stopped, a pending frame wait returns at once
+            self._frame_executor.shutdown(wait=False)
+
+    async def _release(self, loop, capture, controller):
+        """close the camera and the controller, whatever state run() is in"""
+        if capture is not None:
+            try:
+                await loop.run_in_executor(None, self._close_capture, capture)
+            except Exception as e:
+                logger.error('AsyncLocalMonitor._release: %s',
+                             '%s camera: %r' % (self.name, e))
+        if controller is not None:
+            try:
+                await loop.run_in_executor(None, controller.close)
+            except Exception as e:
+                logger.error('AsyncLocalMonitor._release: %s',
+                             '%s controller: %r' % (self.name, e))
+
+    async def _predict(self, loop, predictor, executor, frame):
+        if isinstance(predictor, InferenceClient):
+            # suspicious printers are served first by the pool
+            predict = partial(predictor.predict, frame,
+                              priority=int(self.last_hint != HINT_CLEAR))
+        else:
+            predict = partial(predictor.predict, frame)
+        tic = time.perf_counter()
+        result = await loop.run_in_executor(executor, predict)
+        self.last_inference_at = time.time()
+        self.last_inference_seconds = time.perf_counter() - tic
+        return result
+
+    async def _inspect(self, loop, capture, controller, predictor, executor,
+                       uploader):
+        gate = create_change_gate()
+        judge = FailureJudge(self.event_num, self.failure_num)
+        scheduler = create_scheduler(self.inspection_interval)
+        deadline = loop.time() + self.all_time
+        last_seq = 0
+        while not self._stop_event.is_set():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            # bounded slices, stop() and the deadline are checked between
+            seq, frame, _ = await loop.run_in_executor(
+                self._frame_executor, capture.wait_for_frame, last_seq,
+                min(capture.timeout, remaining))
+            if frame is None:
+                continue
+            last_seq = seq
+            result = gate.check(frame) if gate is not None else None
+            if result is None:
+                result = await self._predict(loop, predictor, executor, frame)
+                if gate is not None:
+                    gate.update(result)
+            self.frame_num += 1
+            self.last_hint = judge.update(result)
+            if judge.failed:
+                logger.info('AsyncLocalMonitor._inspect: %s',
+                            '%s: when the number of detection events exceeds'
+                            ' the predetermined threshold, the switch is'
+                            ' automatically turned off' % self.name)
+                self.failed = True
+                await loop.run_in_executor(None, local_handler, frame, result,
+                                           uploader)
+                await loop.run_in_executor(None, controller.shutdown)
+                return
+            interval = scheduler.update(self.last_hint)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(),
+                                       min(interval, max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                pass
+
+
+class AsyncMonitorRuntime:
+    """
+    runs many AsyncLocalMonitors on one event loop in the calling thread
+    Args:
+        monitors (list): AsyncLocalMonitor
+        infer_pool (InferenceWorkerPool): started pool, every monitor gets
+                                          its own client. None loads one
+                                          detector shared by all monitors,
+                                          its predict calls are serialised
+                                          on a single executor thread.
+    """
+
+    def __init__(self, monitors, infer_pool=None):
+        self.monitors = monitors
+        self.infer_pool = infer_pool
+
+    def run(self):
+        """blocks until every monitor finished"""
+        asyncio.run(self._main())
+
+    def stop(self):
+        """thread safe"""
+        for monitor in self.monitors:
+            monitor.stop()
+
+    async def _main(self):
+        loop = asyncio.get_event_loop()
+        if self.infer_pool is not None:
+            executor = ThreadPoolExecutor(max(len(self.monitors), 1))
+            predictors = [self.infer_pool.client(monitor.roi)
+                          for monitor in self.monitors]
+        else:
+            executor = ThreadPoolExecutor(1)
+            predictor = await loop.run_in_executor(executor, get_predictor, {})
+            if predictor is None:
+                executor.shutdown()
+                return
+            # one detector, every monitor crops its own camera's region
+            predictors = [ROIDetector(predictor, RegionOfInterest(**monitor.roi))
+                          if monitor.roi else predictor
+                          for monitor in self.monitors]
+        uploader = create_uploader()
+        try:
+            # run() handles its own errors, return_exceptions keeps one
+            # printer from ending the others should anything slip through
+            results = await asyncio.gather(
+                *[monitor.run(predictor, executor, uploader)
+                  for monitor, predictor in zip(self.monitors, predictors)],
+                return_exceptions=True)
+            for monitor, result in zip(self.monitors, results):
+                if isinstance(result, BaseException):
+                    logger.error('AsyncMonitorRuntime._main: %s',
+                                 '%s: %r' % (monitor.name, result))
+        finally:
+            if uploader is not None:
+                # spools unsent incidents, never waits on the network
+                await loop.run_in_executor(None, uploader.close)
+            executor.shutdown()
+            for predictor in predictors:
+                if isinstance(predictor, InferenceClient):
+                    predictor.close()
@@ -0,0 +1,75 @@
+import configs
+from monitor_logger.logger import get_logger
+from tools import ChangeGate, BoxTracker
+from tools import HINT_CLEAR, HINT_SUSPICIOUS, HINT_ALARM
+
+logger = get_logger()
+
+
+__all__ = ['FailureJudge', 'create_change_gate',]
+
+
+def create_change_gate():
+    """
+    :return: ChangeGate from configs.CHANGE_GATE, None if disabled
+    """
+    if not configs.CHANGE_GATE['enable']:
+        return None
+    return ChangeGate(configs.CHANGE_GATE['size'],
+                      configs.CHANGE_GATE['threshold'],
+                      configs.CHANGE_GATE['max_skip'])
+
+
+class FailureJudge:
+    """
+    decides from the detections of consecutive inspections whether the
+    print failed. Without a tracker a failure needs event_num inspections
+    with more than failure_num boxes, with configs.TRACKER enabled it needs
+    confirm_num confirmed tracks.
+    Args:
+        event_num (int): bad inspections until the printer is shut down
+        failure_num (int): boxes an inspection may have and still be good
+    """
+
+    def __init__(self, event_num, failure_num):
+        self.event_num = event_num
+        self.failure_num = failure_num
+        self.bad_num = 0
+        self.tracker = None
+        if configs.TRACKER['enable']:
+            tracker_param = dict(configs.TRACKER)
+            tracker_param.pop('enable')
+            self.confirm_num = tracker_param.pop('confirm_num')
+            self.tracker = BoxTracker(**tracker_param)
+
+    @property
+    def failed(self):
+        return self.bad_num >= self.event_num
+
+    def update(self, result):
+        """
+        :param result: DetectionResult of the next inspection
+        :return: scheduling hint, see tools.scheduler
+        """
+        if self.tracker is not None:
+            confirmed_num = self.tracker.update(result)
+            logger.info('FailureJudge.update: %s',
+                        'tracks: %d confirmed: %d/%d'
+                        % (self.tracker.num, confirmed_num, self.confirm_num))
+            if confirmed_num >= self.confirm_num:
+                self.bad_num = self.event_num
+            return (HINT_ALARM if confirmed_num
+                    else HINT_SUSPICIOUS if self.tracker.num
+                    else HINT_CLEAR)
+        if result.get('num', 0) <= self.failure_num:
+            logger.info('FailureJudge.update: %s',
+                        'good work. event num: %d/%d failure num: %d/%d'
+                        % (self.bad_num, self.event_num,
+                           result.get('num', 0), self.failure_num))
+            return HINT_SUSPICIOUS if result.get('num', 0) else HINT_CLEAR
+        self.bad_num += 1
+        logger.info('FailureJudge.update: %s',
+                    'bad work!!! event num: %d/%d failure num: %d/%d'
+                    % (self.bad_num, self.event_num,
+                       result.get('num', 0), self.failure_num))
+        return HINT_ALARM
@@ -0,0 +1,117 @@
+import time
+from datetime import datetime
+from uuid import uuid4
+
+import configs
+from monitor_logger.logger import get_logger
+from infers.worker_pool import InferenceWorkerPool
+from .local_monitor import LocalMonitor
+
+logger = get_logger()
+
+
+__all__ = ['FleetSupervisor',]
+
+
+class FleetSupervisor:
+    """
+    runs one LocalMonitor per printer definition. Every monitor sends its
+    frames to one shared InferenceWorkerPool, which serves frames of
+    printers that looked suspicious first and the rest in arrival order.
+    Args:
+        printers (list): printer definitions, see configs.FLEET_PRINTERS
+        infer_pool (InferenceWorkerPool): started pool, None to start one
+                                          from configs.INFER_WORKER_POOL
+    """
+
+    COLUMNS = ('printer', 'running', 'frames', 'last inference',
+               'infer s', 'queue lag s', 'frame age s')
+
+    def __init__(self, printers=configs.FLEET_PRINTERS, infer_pool=None):
+        names = [printer['name'] for printer in printers]
+        if len(set(names)) != len(names):
+            raise ValueError('printer names must be unique: %s' % names)
+        self.printers = printers
+        self.infer_pool = infer_pool
+        self._own_pool = infer_pool is None
+        self.monitors = {}
+
+    def start(self):
+        if self.infer_pool is None:
+            self.infer_pool = InferenceWorkerPool().start()
+        for printer in self.printers:
+            printer = dict(printer)
+            name = printer.pop('name')
+            self.monitors[name] = LocalMonitor(uuid4(),
+                                               infer_pool=self.infer_pool,
+                                               **printer).start()
+            logger.info('FleetSupervisor.start: %s',
+                        'printer %s camera: %s' % (name,
+                                                   self.monitors[name].camera))
+        return self
+
+    def stop(self, timeout=1.0):
+        """
+        :return: True if every monitor process exited on its own
+        """
+        clean = all([monitor.stop(timeout) for monitor in self.monitors.values()])
+        if self._own_pool and self.infer_pool is not None:
+            self.infer_pool.stop(timeout)
+            self.infer_pool = None
+        return clean
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for monitor in self.monitors.values():
+            monitor.join(None if deadline is None
+                         else max(deadline - time.monotonic(), 0))
+
+    def is_running(self):
+        return any(monitor.get_run_status()
+                   for monitor in self.monitors.values())
+
+    def status(self):
+        """
+        :return: dict, printer name -> Monitor.status()
+        """
+        return {name: monitor.status()
+                for name, monitor in self.monitors.items()}
+
+    @staticmethod
+    def _seconds(value):
+        return '-' if value is None else '%.2f' % value
+
+    def status_rows(self):
+        rows = []
+        for name, status in self.status().items():
+            handler = status['processes'].get('handler', {})
+            last_at = handler.get('last_inference_at')
+            rows.append((name,
+                         'yes' if status['running'] else 'no',
+                         str(handler.get('frames', 0)),
+                         datetime.fromtimestamp(last_at).strftime('%H:%M:%S')
+                         if last_at else '-',
+                         self._seconds(handler.get('last_inference_seconds')),
+                         self._seconds(handler.get('last_queue_seconds')),
+                         self._seconds(status['handoff']['last_staleness']
+                                       or None)))
+        return rows
+
+    def status_table(self):
+        """
+        :return: str, one line per printer
+        """
+        rows = [self.COLUMNS] + self.status_rows()
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(self.COLUMNS))]
+        return '\n'.join('  '.join(cell.ljust(width)
+                                   for cell, width in zip(row, widths))
+                         for row in rows)
+
+    def watch(self, interval=60):
+        """log the status table every interval seconds until every monitor stopped"""
+        while self.is_running():
+            logger.info('FleetSupervisor.watch: %s',
+                        '\n' + self.status_table())
+            time.sleep(interval)
+        logger.info('FleetSupervisor.watch: %s', '\n' + self.status_table())
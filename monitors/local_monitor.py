@@ -2,10 +2,12 @@ import time
 
 import configs
 from monitor_logger.logger import get_logger
-from infers.load_infer import get_infer
-from handlers import local_handler
-from tools import GoodVideoCpature
+from infers.load_infer import get_predictor
+from handlers import local_handler, create_uploader
+from tools import CascadeDetector
+from tools import HINT_CLEAR
 from .monitors import Monitor
+from .decisions import FailureJudge, create_change_gate
 
 logger = get_logger()
 
@@ -19,23 +21,58 @@ class LocalMonitor(Monitor):
                  all_time,
                  inspection_interval=10,
                  failure_num=5,
-                 event_num=5):
+                 event_num=5,
+                 infer_pool=None,
+                 camera=None,
+                 controller=None,
+                 roi=None):
+        """
+        :param infer_pool: started infers.worker_pool.InferenceWorkerPool,
+                           None to load the detector in the handler process
+        :param camera: see Monitor
+        :param controller: see Monitor
+        :param roi: see Monitor
+        """
         super(LocalMonitor, self).__init__(uuid,
                                            all_time,
                                            inspection_interval,
-                                           failure_num)
+                                           failure_num,
+                                           camera,
+                                           controller,
+                                           roi)
         self.event_num = event_num
+        self.infer_pool = infer_pool
 
     def run(self):
         return self._run_monitor()
 
     def _handler(self):
-        event_num = 0
-        infer = get_infer()
-        if not infer:
+        self._set_affinity('handler')
+        tic = time.perf_counter()
+        if self.infer_pool is not None:
+            try:
+                predictor = self.infer_pool.client(self.roi).connect()
+            except ConnectionError as e:
+                logger.error('LocalMonitor._handler: %s', e.__str__())
+                predictor = None
+        else:
+            predictor = get_predictor(self.roi)
+        if predictor is None:
             self.set_run_status(False)
             return
-        predictor = infer.Detector()
+        logger.info('LocalMonitor._handler: %s',
+                    'predictor ready in %.3fs' % (time.perf_counter() - tic))
+        uploader = create_uploader()
+        try:
+            self._handle_frames(predictor, uploader)
+        finally:
+            if uploader is not None:
+                # spools unsent incidents, never waits on the network
+                uploader.close()
+
+    def _handle_frames(self, predictor, uploader):
+        gate = create_change_gate()
+        judge = FailureJudge(self.event_num, self.failure_num)
         start_time = time.time()
         while True:
             if time.time() - start_time >= self.all_time:
@@ -43,32 +80,59 @@ class LocalMonitor(Monitor):
                 return
             if not self.get_run_status():
                 return
-            if event_num == self.event_num:
+            if judge.failed:
                 logger.info('LocalMonitor._handler: %s',
                             'When the number of detection'
                             ' events exceeds the predetermined threshold,'
                             ' the switch is automatically turned off')
-                local_handler(frame, result)
-                event_num = 0
+                local_handler(frame, result, uploader)
                 self._shutdown()
                 self.set_run_status(False)
                 return
             data = self.shared_queue.get()
+            if data is None:
+                # woken up by stop()
+                continue
+            if not self._accept_frame(data):
+                continue
             frame = data['frame']
             current_time = data['current_time']
             logger.info('LocalMonitor._handler: %s',
                          'predict at ' + current_time)
-            result = predictor.predict(frame)
-            if result.get('num', 0) <= self.failure_num:
+            result = gate.check(frame) if gate is not None else None
+            inference_seconds = None
+            queue_seconds = None
+            if result is None:
+                tic = time.perf_counter()
+                if self.infer_pool is not None:
+                    # suspicious printers are served first by the pool
+                    try:
+                        result = predictor.predict(
+                            frame, priority=int(self.last_hint != HINT_CLEAR))
+                    except ConnectionError as e:
+                        # without the pool nothing is monitored, stop the
+                        # detector too instead of dying alone
+                        logger.error('LocalMonitor._handler: %s', e.__str__())
+                        self.set_run_status(False)
+                        return
+                    except RuntimeError as e:
+                        logger.error('LocalMonitor._handler: %s',
+                                     'skip a frame, %s' % e.__str__())
+                        continue
+                    queue_seconds = predictor.last_queue_seconds
+                else:
+                    result = predictor.predict(frame)
+                inference_seconds = time.perf_counter() - tic
+                if gate is not None:
+                    gate.update(result)
+            self._record_frame(inference_seconds, queue_seconds)
+            if gate is not None:
                 logger.info('LocalMonitor._handler: %s',
-                             'good work. event num: %d/%d failure num: %d/%d' % (event_num,
-                                                                                  self.event_num,
-                                                                                  result.get('num', 0),
-                                                                                  self.failure_num))
-                continue
-            event_num += 1
-            logger.info('LocalMonitor._handler: %s',
-                             'bad work!!! event num: %d/%d failure num: %d/%d' % (event_num,
-                                                                                  self.event_num,
-                                                                                  result.get('num', 0),
-                                                                                  self.failure_num))
+                            'change gate diff: %s hit: %d skip: %d'
+                            % (gate.last_diff, gate.hit_num, gate.skip_num))
+            if isinstance(predictor, CascadeDetector):
+                logger.info('LocalMonitor._handler: %s',
+                            'cascade score: %s stage two: %d/%d'
+                            % (predictor.last_score, predictor.stage_two_num,
+                               predictor.frame_num))
+            self.send_hint(judge.update(result))
@@ -1,4 +1,6 @@
+import os
 import time
+import queue
 from datetime import datetime
 import threading
 import multiprocessing as mp
@@ -10,24 +12,77 @@ from monitor_logger.logger import get_logger
 from controllers import get_controller
 from infers.load_infer import get_infer
 from handlers import local_handler
-from tools import GoodVideoCpature
+from tools import GoodVideoCpature, SharedFrameRing, InspectionScheduler
+from tools import HINT_CLEAR, HINT_STOP
 
 logger = get_logger()
 
 
+def create_scheduler(inspection_interval):
+    """
+    :param inspection_interval: seconds, the longest interval
+    :return: InspectionScheduler from configs.SCHEDULER
+    """
+    if not configs.SCHEDULER['enable']:
+        return InspectionScheduler(inspection_interval, inspection_interval)
+    return InspectionScheduler(configs.SCHEDULER['min_interval'] * 60,
+                               inspection_interval,
+                               configs.SCHEDULER['backoff'],
+                               configs.SCHEDULER['tighten'])
+
+
 class Monitor:
     def __init__(self,
                  uuid,
                  all_time,
                  inspection_interval=10,
-                 failure_num=5):
+                 failure_num=5,
+                 camera=None,
+                 controller=None,
+                 roi=None):
+        """
+        :param camera: camera index or url, configs.CAMERA_FILE if None
+        :param controller: dict, 'class' path plus keyword arguments of the
+                           controller, configs.CONTROLLER if None
+        :param roi: RegionOfInterest kwargs of this camera, configs.CAMERA_ROI
+                    if None, {} for the whole frame
+        """
         self.uuid = uuid
+        self.camera = configs.CAMERA_FILE if camera is None else camera
+        self.roi = configs.CAMERA_ROI if roi is None else roi
         self.all_time = all_time * 60
         self.inspection_interval = inspection_interval * 60
         self.failure_num = failure_num
-        self.shared_queue = mp.Queue()
+        latest_wins = configs.FRAME_HANDOFF == 'latest'
+        if configs.SHARED_FRAME_RING:
+            self.shared_queue = SharedFrameRing(configs.FRAME_RING_SLOTS,
+                                                configs.FRAME_RING_MAX_SHAPE,
+                                                latest_wins=latest_wins)
+        else:
+            self.shared_queue = mp.Queue(maxsize=1 if latest_wins else 0)
+        # scheduling hints from the handler back to the detector
+        self.schedule_hints = mp.Queue()
         self._is_run = mp.Value('i', 0)
-        self._controller = get_controller()
+        self._stop_event = mp.Event()
+        # shared counters for status()
+        self._detector_frames = mp.Value('i', 0)
+        self._handler_frames = mp.Value('i', 0)
+        self._last_inference_at = mp.Value('d', 0.)
+        self._last_inference_seconds = mp.Value('d', 0.)
+        self._last_queue_seconds = mp.Value('d', -1.)
+        # last scheduling hint, only meaningful in the handler process
+        self.last_hint = HINT_CLEAR
+        # frame handoff counters, staleness in seconds
+        self._handoff_stats = {'dropped': mp.Value('i', 0),
+                               'stale': mp.Value('i', 0),
+                               'checked': mp.Value('i', 0),
+                               'staleness_sum': mp.Value('d', 0.),
+                               'last_staleness': mp.Value('d', 0.),
+                               'max_staleness': mp.Value('d', 0.)}
+        self._processes = {}
+        controller = dict(controller or {})
+        self._controller = get_controller(controller.pop('class', None),
+                                          **controller)
         self._boot()
 
     def run(self):
@@ -36,8 +91,153 @@ class Monitor:
     def _handler(self):
         raise NotImplementedError('You must implement handler method')
 
+    def start(self):
+        """start the detector and handler processes"""
+        self.run()
+        return self
+
+    def stop(self, timeout=1.0):
+        """
+        stop both processes, blocked waits are woken up at once and a
+        process still busy after timeout seconds is terminated
+        :return: True if every process exited on its own
+        """
+        self.set_run_status(False)
+        deadline = time.monotonic() + timeout
+        clean = True
+        for process in self._processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+                clean = False
+        return clean
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(None if deadline is None
+                         else max(deadline - time.monotonic(), 0))
+
+    def status(self):
+        """
+        :return: dict, run status, per process state and counters
+        """
+        processes = {}
+        for role, process in self._processes.items():
+            processes[role] = {'pid': process.pid,
+                               'alive': process.is_alive(),
+                               'exitcode': process.exitcode}
+        if 'detector' in processes:
+            processes['detector']['frames'] = self._detector_frames.value
+        if 'handler' in processes:
+            processes['handler']['frames'] = self._handler_frames.value
+            processes['handler']['last_inference_at'] = \
+                self._last_inference_at.value or None
+            processes['handler']['last_inference_seconds'] = \
+                self._last_inference_seconds.value or None
+            # time the last frame waited for a shared inference worker
+            processes['handler']['last_queue_seconds'] = \
+                self._last_queue_seconds.value \
+                if self._last_queue_seconds.value >= 0 else None
+        handoff = {name: value.value
+                   for name, value in self._handoff_stats.items()}
+        handoff['mean_staleness'] = \
+            handoff.pop('staleness_sum') / max(handoff.pop('checked'), 1)
+        return {'running': bool(self.get_run_status()),
+                'processes': processes,
+                'handoff': handoff}
+
+    def _record_frame(self, inference_seconds=None, queue_seconds=None):
+        """
+        called from the handler process for every frame it handled
+        :param inference_seconds: None when no inference ran for the frame
+        :param queue_seconds: wait for an InferenceWorkerPool, None when the
+                              handler runs its own detector
+        """
+        with self._handler_frames.get_lock():
+            self._handler_frames.value += 1
+        if inference_seconds is not None:
+            self._last_inference_at.value = time.time()
+            self._last_inference_seconds.value = inference_seconds
+        if queue_seconds is not None:
+            self._last_queue_seconds.value = queue_seconds
+
+    def _count_dropped(self, num):
+        if num:
+            with self._handoff_stats['dropped'].get_lock():
+                self._handoff_stats['dropped'].value += num
+
+    def _put_frame(self, item):
+        """
+        hand a frame to the handler, with FRAME_HANDOFF == 'latest' unread
+        frames are dropped to make room instead of piling up
+        """
+        if isinstance(self.shared_queue, SharedFrameRing):
+            self._count_dropped(self.shared_queue.put(item, timeout=1))
+            return
+        if configs.FRAME_HANDOFF != 'latest':
+            self.shared_queue.put(item, timeout=1)
+            return
+        while True:
+            try:
+                self.shared_queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.shared_queue.get_nowait()
+                self._count_dropped(1)
+            except queue.Empty:
+                pass
+
+    def _accept_frame(self, data):
+        """
+        called from the handler for every frame it receives, records the
+        end-to-end staleness and rejects frames older than FRAME_DEADLINE
+        :return: bool
+        """
+        stats = self._handoff_stats
+        self._count_dropped(data.get('skipped', 0))
+        staleness = time.monotonic() - data['capture_time']
+        with stats['checked'].get_lock():
+            stats['checked'].value += 1
+            stats['staleness_sum'].value += staleness
+            stats['last_staleness'].value = staleness
+            stats['max_staleness'].value = max(stats['max_staleness'].value,
+                                               staleness)
+        if configs.FRAME_DEADLINE and staleness > configs.FRAME_DEADLINE:
+            with stats['stale'].get_lock():
+                stats['stale'].value += 1
+            logger.warning('Monitor._accept_frame: %s',
+                           'drop a frame captured %.1fs ago, deadline %.1fs'
+                           % (staleness, configs.FRAME_DEADLINE))
+            return False
+        return True
+
+    def _interrupt_on_stop(self, capture):
+        self._stop_event.wait()
+        capture.interrupt()
+
+    def _set_affinity(self, role):
+        """pin the calling process to configs.CPU_AFFINITY[role]"""
+        cpus = (configs.CPU_AFFINITY or {}).get(role)
+        if cpus and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError as e:
+                logger.error('Monitor._set_affinity: %s', e.__str__())
+        if hasattr(os, 'sched_getaffinity'):
+            logger.info('Monitor._set_affinity: %s',
+                        '%s pid: %d cpus: %s' % (role, os.getpid(),
+                                                 sorted(os.sched_getaffinity(0))))
+
     def _detector(self):
-        capture = GoodVideoCpature.create(configs.CAMERA_FILE)
+        self._set_affinity('detector')
+        capture = GoodVideoCpature.create(
+            self.camera,
+            decode_on_demand=configs.CAPTURE_DECODE_ON_DEMAND,
+            profile=configs.CAPTURE_PROFILES.get(configs.CAPTURE_PROFILE))
         capture.start_read()
         if not capture.is_started():
             EXIT = -1
@@ -49,7 +249,13 @@ class Monitor:
             return
         logger.info('Monitor._detector: %s',
                     'Start monitor...')
+        interrupter = threading.Thread(target=self._interrupt_on_stop,
+                                       args=(capture,))
+        interrupter.daemon = True
+        interrupter.start()
+        scheduler = self._create_scheduler()
         start_time = time.time()
+        last_seq = 0
         while True:
             if time.time() - start_time >= self.all_time:
                 capture.stop_read()
@@ -60,18 +266,58 @@ class Monitor:
                 capture.stop_read()
                 capture.release()
                 return
-            retval, frame = capture.read_latest_frame()
-            if not retval:
+            seq, frame, capture_time = capture.wait_for_frame(last_seq)
+            if frame is None:
+                if not self.get_run_status():
+                    continue
                 logger.warning('Monitor._detector: %s',
                                'No frame was read')
                 continue
-            logger.info('Monitor._detector: %s', 'get a frame')
+            last_seq = seq
+            logger.info('Monitor._detector: %s',
+                        'get a frame, grabbed: %(grabbed)d'
+                        ' decoded: %(decoded)d' % capture.get_frame_counters())
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.shared_queue.put({
-                'frame': frame,
-                'current_time': current_time
-            })
-            time.sleep(self.inspection_interval)
+            try:
+                self._put_frame({
+                    'frame': frame,
+                    'current_time': current_time,
+                    'capture_time': capture_time
+                })
+            except ValueError as e:
+                logger.error('Monitor._detector: %s', e.__str__())
+            except queue.Full:
+                logger.warning('Monitor._detector: %s',
+                               'The handler is busy, frame dropped')
+            else:
+                with self._detector_frames.get_lock():
+                    self._detector_frames.value += 1
+            self._wait_next_inspection(scheduler)
+
+    def _create_scheduler(self):
+        return create_scheduler(self.inspection_interval)
+
+    def _wait_next_inspection(self, scheduler):
+        """sleep for the scheduled interval, hints may shorten the wait"""
+        start = time.monotonic()
+        while True:
+            remaining = start + scheduler.interval - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                hint = self.schedule_hints.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if hint == HINT_STOP:
+                return
+            interval = scheduler.update(hint)
+            logger.info('Monitor._wait_next_inspection: %s',
+                        'hint: %s next interval: %.1fs' % (hint, interval))
+
+    def send_hint(self, hint):
+        """called from the handler process, see tools.scheduler"""
+        self.last_hint = hint
+        self.schedule_hints.put(hint)
 
     def _shutdown(self):
         self._controller.shutdown()
@@ -83,18 +329,52 @@ class Monitor:
         self.set_run_status(True)
         d = mp.Process(target=self._detector)
         h = mp.Process(target=self._handler)
+        self._processes = {'detector': d, 'handler': h}
         d.start()
         h.start()
         return d, h
 
     def set_run_status(self, is_run):
         if is_run:
+            self._stop_event.clear()
             self._is_run.value = 1
-        else:
-            self._is_run.value = 0
+            return
+        self._is_run.value = 0
+        if not self._stop_event.is_set():
+            self._stop_event.set()
+            # wake the detector's wait and the handler's blocked get()
+            self.schedule_hints.put(HINT_STOP)
+            if isinstance(self.shared_queue, SharedFrameRing):
+                self.shared_queue.wake()
+            else:
+                self._wake_handler()
+
+    def _wake_handler(self):
+        """
+        never blocks: the handler may be the caller and the only reader of
+        a full maxsize=1 queue, the stale frame is dropped to make room
+        """
+        try:
+            self.shared_queue.put_nowait(None)
+            return
+        except queue.Full:
+            pass
+        try:
+            self.shared_queue.get_nowait()
+            self._count_dropped(1)
+        except queue.Empty:
+            pass
+        try:
+            self.shared_queue.put_nowait(None)
+        except queue.Full:
+            # the detector refilled it, get_run_status() ends the handler
+            pass
 
     def get_run_status(self):
         return self._is_run.value
 
     def __del__(self):
         self._controller.close()
+        if isinstance(self.shared_queue, SharedFrameRing):
+            self.shared_queue.close()
+            self.shared_queue.unlink()
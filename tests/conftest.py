@@ -0,0 +1,19 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# the controllers package imports the Raspberry Pi and serial port modules,
+# the tests replace every controller, so empty stand-ins are enough off
+# the device
+for _name in ('RPi.GPIO', 'serial'):
+    try:
+        __import__(_name)
+    except ImportError:
+        sys.modules[_name] = types.ModuleType(_name)
+if 'RPi' not in sys.modules:
+    sys.modules['RPi'] = types.ModuleType('RPi')
+sys.modules['RPi'].GPIO = sys.modules['RPi.GPIO']
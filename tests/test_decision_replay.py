@@ -0,0 +1,174 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import configs
+import monitors.monitors as monitors_module
+import monitors.local_monitor as local_monitor_module
+import monitors.async_monitor as async_monitor_module
+from monitors.decisions import FailureJudge
+from monitors import LocalMonitor, AsyncLocalMonitor
+from tools import DetectionResult
+
+
+# boxes per inspection, more than FAILURE_NUM is a bad inspection
+SEQUENCES = {
+    'fails': [0, 1, 3, 0, 4, 5, 2, 6, 7, 0, 0, 9, 9],
+    'clear': [0, 1, 2, 0, 1, 2, 0],
+}
+FAILURE_NUM = 2
+EVENT_NUM = 3
+
+
+def _result(box_num):
+    # growing boxes at fixed places, so the tracker can follow them too
+    return DetectionResult(np.array([[0, 0.9, 20 * k, 10, 20 * k + 8 + box_num,
+                                      20 + box_num]
+                                     for k in range(box_num)],
+                                    dtype=np.float64).reshape(-1, 6))
+
+
+def _frame(index):
+    return np.full((8, 8, 3), index, dtype=np.uint8)
+
+
+class StubPredictor:
+    """frame i gets the i-th result of the sequence"""
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+    def predict(self, frame):
+        return _result(self.sequence[int(frame[0, 0, 0])])
+
+
+class StubController:
+    def __init__(self, log):
+        self.log = log
+
+    def boot(self):
+        pass
+
+    def shutdown(self):
+        self.log.append(('shutdown', len(self.log)))
+
+    def close(self):
+        pass
+
+
+class StubFrameQueue:
+    """hands the sequence to LocalMonitor._handle_frames, stops it at the end"""
+
+    def __init__(self, monitor, sequence):
+        self.monitor = monitor
+        self.index = 0
+        self.sequence = sequence
+
+    def get(self):
+        if self.index >= len(self.sequence):
+            self.monitor.set_run_status(False)
+            return None
+        self.index += 1
+        return {'frame': _frame(self.index - 1),
+                'current_time': '',
+                'capture_time': time.monotonic()}
+
+    def put_nowait(self, item):
+        pass
+
+
+class StubCapture:
+    """hands the sequence to AsyncLocalMonitor, stops it at the end"""
+    timeout = 3
+
+    def __init__(self, monitor, sequence):
+        self.monitor = monitor
+        self.index = 0
+        self.sequence = sequence
+
+    def wait_for_frame(self, last_seq=0, timeout=None):
+        if self.index >= len(self.sequence):
+            self.monitor.stop()
+            time.sleep(0.01)
+            return last_seq, None, None
+        self.index += 1
+        return self.index, _frame(self.index - 1), time.monotonic()
+
+    def interrupt(self):
+        pass
+
+    def stop_read(self):
+        pass
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def decisions(monkeypatch):
+    """
+    replace the hardware, record every FailureJudge decision, the upload
+    and the controller shutdown in order
+    """
+    log = []
+    monkeypatch.setattr(configs, 'SHARED_FRAME_RING', False)
+    monkeypatch.setattr(configs, 'FRAME_DEADLINE', None)
+    monkeypatch.setattr(configs, 'CPU_AFFINITY', None)
+    monkeypatch.setitem(configs.CHANGE_GATE, 'enable', False)
+    monkeypatch.setitem(configs.SCHEDULER, 'enable', False)
+    controller = StubController(log)
+    get_controller = lambda controller_class=None, **kwargs: controller
+    monkeypatch.setattr(monitors_module, 'get_controller', get_controller)
+    monkeypatch.setattr(async_monitor_module, 'get_controller', get_controller)
+    upload = lambda frame, result, uploader=None: log.append(('upload', result.num))
+    monkeypatch.setattr(local_monitor_module, 'local_handler', upload)
+    monkeypatch.setattr(async_monitor_module, 'local_handler', upload)
+    update = FailureJudge.update
+
+    def recording_update(judge, result):
+        hint = update(judge, result)
+        log.append(('decision', result.num, hint, judge.bad_num))
+        return hint
+    monkeypatch.setattr(FailureJudge, 'update', recording_update)
+    return log
+
+
+def _replay_process_monitor(sequence):
+    monitor = LocalMonitor('replay', 60, inspection_interval=1e-4,
+                           failure_num=FAILURE_NUM, event_num=EVENT_NUM)
+    monitor.shared_queue = StubFrameQueue(monitor, sequence)
+    monitor.set_run_status(True)
+    monitor._handle_frames(StubPredictor(sequence), None)
+
+
+def _replay_async_monitor(sequence):
+    monitor = AsyncLocalMonitor('replay', 60, inspection_interval=1e-4,
+                                failure_num=FAILURE_NUM, event_num=EVENT_NUM)
+    monitor._open_capture = lambda: StubCapture(monitor, sequence)
+    with ThreadPoolExecutor(1) as executor:
+        asyncio.run(monitor.run(StubPredictor(sequence), executor))
+    return monitor
+
+
+@pytest.mark.parametrize('tracker', [False, True])
+@pytest.mark.parametrize('name', sorted(SEQUENCES))
+def test_same_decisions_in_both_runtimes(decisions, monkeypatch, name, tracker):
+    monkeypatch.setitem(configs.TRACKER, 'enable', tracker)
+    sequence = SEQUENCES[name]
+    _replay_process_monitor(sequence)
+    process_log = list(decisions)
+    del decisions[:]
+    monitor = _replay_async_monitor(sequence)
+    assert decisions == process_log
+    failed = ('shutdown', len(process_log) - 1) in process_log
+    assert monitor.failed == failed
+    if name == 'fails' and not tracker:
+        # the third bad inspection, the sixth frame, shuts the printer down
+        assert process_log[-2:] == [('upload', 5), ('shutdown', 7)]
+        assert [entry[3] for entry in process_log[:6]] == [0, 0, 1, 1, 2, 3]
+    if name == 'clear' and not tracker:
+        assert not failed
+        assert len(process_log) == len(sequence)
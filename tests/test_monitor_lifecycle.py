@@ -0,0 +1,77 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import configs
+import monitors.monitors as monitors_module
+import monitors.local_monitor as local_monitor_module
+from monitors import LocalMonitor
+from tools import DetectionResult
+
+
+class StubController:
+    def boot(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubPredictor:
+    def predict(self, frame):
+        time.sleep(0.05)
+        return DetectionResult()
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / 'camera.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25,
+                             (64, 48))
+    for i in range(50):
+        writer.write(np.full((48, 64, 3), i * 5, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def monitor(monkeypatch, video):
+    monkeypatch.setattr(configs, 'CAPTURE_PROFILE', None)
+    # a file is read faster than a camera, decode every frame so the
+    # detector still finds one
+    monkeypatch.setattr(configs, 'CAPTURE_DECODE_ON_DEMAND', False)
+    monkeypatch.setattr(configs, 'CPU_AFFINITY', None)
+    monkeypatch.setitem(configs.INCIDENT_UPLOADER, 'enable', False)
+    monkeypatch.setattr(monitors_module, 'get_controller',
+                        lambda controller_class=None, **kwargs: StubController())
+    monkeypatch.setattr(local_monitor_module, 'get_predictor',
+                        lambda *args, **kwargs: StubPredictor())
+    monitor = LocalMonitor('lifecycle', 60, inspection_interval=1e-3,
+                           event_num=1, failure_num=2, camera=video)
+    yield monitor
+    monitor.stop()
+
+
+def test_stop_is_fast_and_clean(monitor):
+    monitor.start()
+    deadline = time.monotonic() + 10
+    while (monitor.status()['processes']['handler'].get('frames', 0) < 1
+           and time.monotonic() < deadline):
+        time.sleep(0.05)
+    status = monitor.status()
+    assert status['running']
+    assert status['processes']['handler']['frames'] >= 1
+    tic = time.monotonic()
+    clean = monitor.stop()
+    assert time.monotonic() - tic < 1.0
+    assert clean
+    status = monitor.status()
+    assert not status['running']
+    for role in ('detector', 'handler'):
+        assert not status['processes'][role]['alive']
+        assert status['processes'][role]['exitcode'] == 0
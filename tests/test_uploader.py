@@ -0,0 +1,169 @@
+import json
+import time
+import socket
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from tools import IncidentSpool, IncidentUploader
+from tools.incidents import create_incident_payload
+
+
+IMAGE = 'x' * 20000
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        # json_base64 sends the response as a json string
+        response = json.loads(body['response'])
+        self.server.started.append(response)
+        time.sleep(self.server.delay)
+        self.server.received.append(response)
+        answer = b'{"code": 1}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """stand-in incident server, delay seconds slow per request"""
+    daemon_threads = True
+
+    def __init__(self, port, delay=0.):
+        HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        self.delay = delay
+        self.started = []
+        self.received = []
+
+
+@pytest.fixture
+def port():
+    """a port nobody listens on until a test starts a server there"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def start_server(port):
+    servers = []
+
+    def start(delay=0.):
+        server = _Server(port, delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / 'incidents.jsonl')
+
+
+def _spooled(uploader):
+    """the responses left in the spool, oldest first"""
+    responses = []
+    while True:
+        entry = uploader.spool.peek()
+        if entry is None:
+            return responses
+        responses.append(entry[0]['response'])
+        uploader.spool.pop(entry[1], entry[0]['incident_id'])
+
+
+def _wait_for(condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_submit_never_blocks_when_refused(port, spool_path):
+    uploader = IncidentUploader('127.0.0.1:%d' % port, spool_path,
+                                queue_size=2, backoff=10)
+    tic = time.monotonic()
+    for i in range(5):
+        uploader.submit(IMAGE, {'i': i})
+    assert time.monotonic() - tic < 0.5
+    assert _wait_for(lambda: uploader.retry_num >= 1)
+    tic = time.monotonic()
+    uploader.close()
+    assert time.monotonic() - tic < 0.5
+    assert sorted(response['i'] for response in _spooled(uploader)) \
+        == list(range(5))
+
+
+def test_spool_replayed_after_restart(port, spool_path, start_server):
+    domain = '127.0.0.1:%d' % port
+    uploader = IncidentUploader(domain, spool_path, backoff=10)
+    for i in range(3):
+        uploader.submit(IMAGE, {'i': i})
+    assert _wait_for(lambda: uploader.retry_num >= 1)
+    uploader.close()
+    assert uploader.spool.pending_bytes()
+    server = start_server()
+    uploader = IncidentUploader(domain, spool_path, backoff=0.1)
+    uploader.submit(IMAGE, {'i': 'new'})
+    assert _wait_for(lambda: len(server.received) == 4)
+    uploader.close()
+    assert sorted(str(response['i']) for response in server.received) \
+        == ['0', '1', '2', 'new']
+    assert uploader.status()['spool_bytes'] == 0
+
+
+def test_close_never_waits_on_a_slow_server(port, spool_path, start_server):
+    server = start_server(delay=5.)
+    uploader = IncidentUploader('127.0.0.1:%d' % port, spool_path,
+                                timeout=(1, 30))
+    uploader.submit(IMAGE, {'i': 'in flight'})
+    assert _wait_for(lambda: server.started)
+    uploader.submit(IMAGE, {'i': 'queued'})
+    tic = time.monotonic()
+    uploader.close()
+    assert time.monotonic() - tic < 0.2
+    # both are kept for the next uploader
+    assert _spooled(uploader) == [{'i': 'in flight'}, {'i': 'queued'}]
+
+
+def test_oldest_incidents_evicted_when_spool_full(port, spool_path):
+    uploader = IncidentUploader('127.0.0.1:%d' % port, spool_path,
+                                queue_size=1, max_spool_bytes=100000,
+                                backoff=10)
+    for i in range(12):
+        uploader.submit(IMAGE, {'i': i})
+    uploader.close()
+    status = uploader.status()
+    assert status['evicted'] > 0
+    assert status['spool_bytes'] <= 100000
+    kept = [response['i'] for response in _spooled(uploader)]
+    assert len(kept) + status['evicted'] == 12
+    # the newest incident survives
+    assert 11 in kept
+
+
+def test_stale_pop_after_eviction_keeps_the_new_entry(spool_path):
+    spool = IncidentSpool(spool_path, max_bytes=50000)
+    spool.append(create_incident_payload(IMAGE, {'i': 0}))
+    payload, offset = spool.peek()
+    assert offset == 0
+    # two more entries evict the peeked one and rewrite the file from 0
+    spool.append(create_incident_payload(IMAGE, {'i': 1}))
+    spool.append(create_incident_payload(IMAGE, {'i': 2}))
+    assert spool.evicted_num == 1
+    spool.pop(offset, payload['incident_id'])
+    assert spool.peek()[0]['response'] == {'i': 1}
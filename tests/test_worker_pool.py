@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+import pytest
+
+import configs
+import infers.worker_pool as worker_pool_module
+import monitors.monitors as monitors_module
+from infers.worker_pool import InferenceClient, InferenceWorkerPool
+from monitors import LocalMonitor
+from tools import DetectionResult
+
+
+class StubController:
+    def boot(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubPredictor:
+    """fails on frames filled with 255"""
+
+    def predict(self, frame):
+        if frame.size and frame.flat[0] == 255:
+            raise ValueError('broken frame')
+        return DetectionResult()
+
+
+class StubFrameQueue:
+    """hands the frames to LocalMonitor._handle_frames, stops it at the end"""
+
+    def __init__(self, monitor, frames):
+        self.monitor = monitor
+        self.frames = list(frames)
+
+    def get(self):
+        if not self.frames:
+            self.monitor.set_run_status(False)
+            return None
+        return {'frame': self.frames.pop(0),
+                'current_time': '',
+                'capture_time': time.monotonic()}
+
+    def put_nowait(self, item):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(configs, 'CPU_AFFINITY', None)
+    monkeypatch.setattr(worker_pool_module, 'get_predictor',
+                        lambda *args, **kwargs: StubPredictor())
+    monkeypatch.setattr(InferenceClient, 'CONNECT_TIMEOUT', 0.5)
+    pool = InferenceWorkerPool(address=str(tmp_path / 'pool.sock'),
+                               worker_num=1, warmup_shape=(8, 8, 3),
+                               warmup_runs=1, batch_window=0).start(timeout=10)
+    yield pool
+    pool.stop()
+
+
+@pytest.fixture
+def monitor(monkeypatch, pool):
+    monkeypatch.setattr(configs, 'SHARED_FRAME_RING', False)
+    monkeypatch.setattr(configs, 'FRAME_DEADLINE', None)
+    monkeypatch.setitem(configs.CHANGE_GATE, 'enable', False)
+    monkeypatch.setattr(monitors_module, 'get_controller',
+                        lambda controller_class=None, **kwargs: StubController())
+    return LocalMonitor('pool', 60, infer_pool=pool)
+
+
+def _frames(values):
+    return [np.full((8, 8, 3), value, dtype=np.uint8) for value in values]
+
+
+def test_handler_stops_the_monitor_when_the_worker_dies(pool, monitor):
+    client = pool.client().connect()
+    monitor.shared_queue = StubFrameQueue(monitor, _frames(range(5)))
+    monitor.set_run_status(True)
+    pool._workers[0].kill()
+    pool._workers[0].join()
+    tic = time.monotonic()
+    # returns instead of raising, and stops the detector with it
+    monitor._handle_frames(client, None)
+    assert time.monotonic() - tic < 3
+    assert not monitor.get_run_status()
+    assert monitor.status()['running'] is False
+
+
+def test_failed_inference_skips_the_frame(pool, monitor):
+    client = pool.client().connect()
+    monitor.shared_queue = StubFrameQueue(monitor, _frames([1, 255, 2]))
+    monitor.set_run_status(True)
+    monitor._handle_frames(client, None)
+    assert monitor._handler_frames.value == 2
+    client.close()
@@ -2,5 +2,15 @@ from .network_test import check_network
 from .preprocess import *
 from .visualize import *
 from .good_videocapture import *
+from .frame_ring import *
+from .change_gate import *
 from .image_converter import *
 from .incidents import *
+from .detection import *
+from .tiling import *
+from .roi import *
+from .adaptive_resolution import *
+from .cascade import *
+from .tracker import *
+from .scheduler import *
+from .uploader import *
@@ -0,0 +1,100 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from monitor_logger.logger import get_logger
+
+
+logger = get_logger()
+
+
+__all__ = ['AdaptiveResolution',]
+
+
+class AdaptiveResolution:
+    """
+    keeps the inference latency within a budget by switching the model
+    input resolution of a Detector, and goes to full resolution as soon as
+    a suspicious box shows up
+    Args:
+        detector: infers Detector with set_input_size
+        sizes (list): input sizes to choose from, e.g. [320, 416, 608]
+        latency_budget (float): seconds a predict call may take
+        headroom (float): step up while the rolling latency, scaled by the
+                          pixel ratio of the next size, stays below
+                          headroom * latency_budget
+        window (int): number of calls the rolling latency is averaged over
+        suspicious_score (float): score from which a box escalates to full
+                                  resolution
+    """
+
+    def __init__(self,
+                 detector,
+                 sizes=(320, 416, 608),
+                 latency_budget=2.0,
+                 headroom=0.8,
+                 window=5,
+                 suspicious_score=0.3):
+        self.detector = detector
+        self.sizes = sorted(sizes)
+        self.latency_budget = latency_budget
+        self.headroom = headroom
+        self.suspicious_score = suspicious_score
+        self._latencies = deque(maxlen=window)
+        self._index = len(self.sizes) - 1
+        self.detector.set_input_size(self.size)
+
+    @property
+    def size(self):
+        return self.sizes[self._index]
+
+    def _switch(self, index, reason, latency):
+        logger.info('AdaptiveResolution._switch: %s',
+                    'input size %d -> %d, %s, latency: %.3fs budget: %.3fs'
+                    % (self.size, self.sizes[index], reason, latency,
+                       self.latency_budget))
+        self._index = index
+        self._latencies.clear()
+        self.detector.set_input_size(self.size)
+
+    def _is_suspicious(self, results):
+        return any(result.num and result.scores.max() >= self.suspicious_score
+                   for result in results)
+
+    def _timed(self, func, *args, **kwargs):
+        tic = time.perf_counter()
+        results = func(*args, **kwargs)
+        return results, time.perf_counter() - tic
+
+    def _adapt(self, latency):
+        self._latencies.append(latency)
+        rolling = float(np.mean(self._latencies))
+        top = len(self.sizes) - 1
+        if rolling > self.latency_budget and self._index > 0:
+            self._switch(self._index - 1, 'over budget', rolling)
+        elif self._index < top and len(self._latencies) == self._latencies.maxlen:
+            # latency grows roughly with the number of input pixels
+            ratio = (self.sizes[self._index + 1] / float(self.size)) ** 2
+            if rolling * ratio < self.headroom * self.latency_budget:
+                self._switch(self._index + 1, 'headroom', rolling)
+
+    def _run(self, func, images, **kwargs):
+        results, latency = self._timed(func, images, **kwargs)
+        top = len(self.sizes) - 1
+        if self._index < top and self._is_suspicious(results):
+            self._switch(top, 'suspicious detection', latency)
+            results, latency = self._timed(func, images, **kwargs)
+        if self._index == top and self._is_suspicious(results):
+            # hold full resolution while the failure is being confirmed
+            return results
+        self._adapt(latency)
+        return results
+
+    def predict_batch(self, images, **kwargs):
+        return self._run(self.detector.predict_batch, images, **kwargs)
+
+    def predict(self, image, **kwargs):
+        return self._run(
+            lambda images, **kw: [self.detector.predict(images[0], **kw)],
+            [image], **kwargs)[0]
@@ -0,0 +1,80 @@
+from .detection import DetectionResult
+
+
+__all__ = ['LowResScreener', 'CascadeDetector',]
+
+
+def screen_score(result):
+    """highest box score of a DetectionResult, or the score a classifier returned"""
+    if isinstance(result, DetectionResult):
+        return float(result.scores.max()) if result.num else 0.
+    return float(result)
+
+
+class LowResScreener:
+    """
+    first cascade stage made of a low resolution pass of the full detector
+    Args:
+        detector: infers Detector with set_input_size and input_size
+        size (int): input size of the screening pass
+    """
+
+    def __init__(self, detector, size=320):
+        self.detector = detector
+        self.size = size
+
+    def predict(self, image, **kwargs):
+        full_size = self.detector.input_size
+        self.detector.set_input_size(self.size)
+        try:
+            return self.detector.predict(image, **kwargs)
+        finally:
+            self.detector.set_input_size(full_size)
+
+
+class CascadeDetector:
+    """
+    runs a cheap screener on every frame and the full detector only on
+    the frames the screener scores at or above threshold
+    Args:
+        detector: full detector, infers Detector, TiledDetector, ...
+        screener: object whose predict(frame) returns a DetectionResult or
+                  a float score
+        threshold (float): screener score that invokes the full detector
+    """
+
+    def __init__(self, detector, screener, threshold=0.05):
+        self.detector = detector
+        self.screener = screener
+        self.threshold = threshold
+        self.frame_num = 0
+        self.stage_two_num = 0
+        self.last_score = None
+
+    def predict(self, image, **kwargs):
+        self.frame_num += 1
+        self.last_score = screen_score(self.screener.predict(image))
+        if self.last_score < self.threshold:
+            return DetectionResult()
+        self.stage_two_num += 1
+        return self.detector.predict(image, **kwargs)
+
+    def predict_batch(self, images, **kwargs):
+        """screens every frame and runs the passing ones as one batch"""
+        results = [DetectionResult() for _ in images]
+        passed = []
+        for index, image in enumerate(images):
+            self.frame_num += 1
+            self.last_score = screen_score(self.screener.predict(image))
+            if self.last_score >= self.threshold:
+                passed.append(index)
+        if passed:
+            self.stage_two_num += len(passed)
+            stage_two = self.detector.predict_batch(
+                [images[index] for index in passed], **kwargs)
+            for index, result in zip(passed, stage_two):
+                results[index] = result
+        return results
+
+    def get_counters(self):
+        return {'frame': self.frame_num, 'stage_two': self.stage_two_num}
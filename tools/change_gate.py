@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+
+__all__ = ['ChangeGate',]
+
+
+class ChangeGate:
+    """
+    cheap pre-inference gate, compares a small grayscale thumbnail of the
+    frame with the one of the last inferred frame and hands back the cached
+    result while the scene has not meaningfully changed
+    Args:
+        size (int): side of the thumbnail
+        threshold (float): mean absolute gray level difference (0-255)
+                           below which a frame counts as unchanged
+        max_skip (int): run inference anyway after this many skips in a row
+    """
+
+    def __init__(self, size=64, threshold=4.0, max_skip=5):
+        self.size = size
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.hit_num = 0
+        self.skip_num = 0
+        self.last_diff = None
+        self._skip_run = 0
+        self._thumbnail = None
+        self._pending = None
+        self._result = None
+
+    def _make_thumbnail(self, frame):
+        thumbnail = cv2.resize(frame, (self.size, self.size),
+                               interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail.astype(np.int16)
+
+    def check(self, frame):
+        """
+        :param frame: BGR ndarray
+        :return: the cached result when the frame is unchanged, else None
+        """
+        self._pending = self._make_thumbnail(frame)
+        if self._thumbnail is None or self._skip_run >= self.max_skip:
+            self.last_diff = None
+        else:
+            self.last_diff = float(np.abs(self._pending - self._thumbnail).mean())
+            if self.last_diff < self.threshold:
+                self._skip_run += 1
+                self.skip_num += 1
+                return self._result
+        self.hit_num += 1
+        return None
+
+    def update(self, result):
+        """remember the result inferred on the frame passed to check()"""
+        self._thumbnail = self._pending
+        self._result = result
+        self._skip_run = 0
+
+    def get_counters(self):
+        return {'hit': self.hit_num, 'skip': self.skip_num}
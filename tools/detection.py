@@ -0,0 +1,136 @@
+import copy
+
+import numpy as np
+
+from .incidents import INCIDENT_STYLE, LABEL_STYLE
+
+
+__all__ = ['DetectionResult',]
+
+
+class DetectionResult:
+    """
+    compact detection result, one [N, 6] float64 array of
+    [class, score, x_min, y_min, x_max, y_max] rows.
+    It still answers result['boxes'], result['num'], result.get(...) and
+    'masks' in result, so code written against the old result dict keeps
+    working.
+    Args:
+        boxes (np.ndarray): shape [N, 6]
+        masks (np.ndarray): MaskRCNN masks, shape [N, class_num, res, res]
+    """
+    __slots__ = ('boxes', 'masks')
+
+    def __init__(self, boxes=None, masks=None):
+        if boxes is None or len(boxes) == 0:
+            boxes = np.zeros((0, 6), dtype=np.float64)
+        self.boxes = boxes
+        self.masks = masks
+
+    @classmethod
+    def from_output(cls, np_boxes, threshold=0.5, np_masks=None):
+        """
+        filter the raw predictor output by score and round it, vectorized
+        :param np_boxes: [N, 6] predictor output
+        :param threshold: threshold of predicted box' score
+        :param np_masks: masks matching np_boxes or None
+        :return: DetectionResult
+        """
+        expect_boxes = (np_boxes[:, 1] > threshold) & (np_boxes[:, 0] > -1)
+        boxes = np_boxes[expect_boxes, :].astype(np.float64)
+        boxes[:, 0] = np.floor(boxes[:, 0])
+        boxes[:, 1] = np.round(boxes[:, 1], 4)
+        boxes[:, 2:] = np.round(boxes[:, 2:], 2)
+        if np_masks is not None:
+            np_masks = np_masks[expect_boxes, :, :, :]
+        return cls(boxes, np_masks)
+
+    @classmethod
+    def split_batch(cls, np_boxes, lod, batch_size, threshold=0.5,
+                    np_masks=None):
+        """
+        split the output of a batched forward pass back per image
+        :param np_boxes: [N, 6] predictor output of the whole batch or None
+        :param lod: level of detail of the output, lod[0] holds the row
+                    offset of every image, e.g. [0, 3, 3, 5]
+        :param batch_size: number of images in the batch
+        :param threshold: threshold of predicted box' score
+        :param np_masks: masks matching np_boxes or None
+        :return: list of DetectionResult
+        """
+        if np_boxes is None or np_boxes.size < 6:
+            return [cls() for _ in range(batch_size)]
+        if lod and len(lod[0]) == batch_size + 1:
+            offsets = np.asarray(lod[0])
+        elif batch_size == 1:
+            offsets = np.array([0, len(np_boxes)])
+        else:
+            raise ValueError('can not split %d boxes into %d images with lod %s'
+                             % (len(np_boxes), batch_size, lod))
+        batch_index = np.repeat(np.arange(batch_size), np.diff(offsets))
+        results = []
+        for i in range(batch_size):
+            in_image = batch_index == i
+            masks = np_masks[in_image] if np_masks is not None else None
+            results.append(cls.from_output(np_boxes[in_image], threshold, masks))
+        return results
+
+    @property
+    def num(self):
+        return len(self.boxes)
+
+    @property
+    def clsids(self):
+        return self.boxes[:, 0].astype(np.int32)
+
+    @property
+    def scores(self):
+        return self.boxes[:, 1]
+
+    @property
+    def xyxy(self):
+        return self.boxes[:, 2:]
+
+    def to_incidents(self, label_key='failue', label_desc='置信度', style=None):
+        """
+        :return: list of incident dicts, see tools.incidents.Incident
+        """
+        if style is None:
+            style = INCIDENT_STYLE
+        xyxy = self.xyxy
+        lefts, tops = xyxy[:, 0].tolist(), xyxy[:, 1].tolist()
+        widths = (xyxy[:, 2] - xyxy[:, 0]).tolist()
+        heights = (xyxy[:, 3] - xyxy[:, 1]).tolist()
+        return [{'location': {'left': left,
+                              'top': top,
+                              'width': width,
+                              'height': height},
+                 'label': {'key': label_key,
+                           'key_desc': label_desc,
+                           'value': str(score),
+                           'style': copy.deepcopy(LABEL_STYLE)},
+                 'style': copy.deepcopy(style)}
+                for left, top, width, height, score
+                in zip(lefts, tops, widths, heights, self.scores.tolist())]
+
+    def __getitem__(self, key):
+        if key == 'boxes':
+            return self.boxes
+        if key == 'num':
+            return self.num
+        if key == 'masks' and self.masks is not None:
+            return self.masks
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ('boxes', 'num') or (key == 'masks'
+                                           and self.masks is not None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return 'DetectionResult(num=%d)' % self.num
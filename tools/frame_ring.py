@@ -0,0 +1,155 @@
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+__all__ = ['SharedFrameRing',]
+
+
+class SharedFrameRing:
+    """
+    fixed-size ring of preallocated shared memory frame slots. Only the slot
+    index, frame shape and the rest of the item metadata travel through the
+    internal queue, the pixels are copied once into shared memory and read
+    back as a zero-copy numpy view.
+
+    It behaves like the mp.Queue it replaces: put() takes a dict with a
+    'frame' key and get() returns the same kind of dict. The frame returned
+    by get() stays valid until the next get() in the same process, copy it
+    if it has to live longer.
+    Args:
+        slot_num (int): number of frame slots
+        max_shape (tuple): largest frame (h, w, c) a slot can hold
+        dtype (str): dtype of the frames
+        latest_wins (bool): when every slot is taken, put() overwrites the
+                            oldest frame nobody has read yet instead of
+                            waiting for the reader
+    """
+
+    def __init__(self, slot_num=4, max_shape=(1080, 1920, 3), dtype='uint8',
+                 latest_wins=False):
+        self.slot_num = slot_num
+        self.latest_wins = latest_wins
+        self.max_shape = tuple(max_shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_size = int(np.prod(self.max_shape)) * self.dtype.itemsize
+        self._shms = [shared_memory.SharedMemory(create=True,
+                                                 size=self.slot_size)
+                      for _ in range(slot_num)]
+        self._free_slots = mp.Queue()
+        for slot in range(slot_num):
+            self._free_slots.put(slot)
+        self._items = mp.Queue()
+        self._held_slot = None
+
+    def _slot_view(self, slot, shape):
+        return np.ndarray(shape, dtype=self.dtype, buffer=self._shms[slot].buf)
+
+    def put(self, item, block=True, timeout=None):
+        """
+        copy item['frame'] into a free slot and publish the metadata
+        :param item: dict, must contain 'frame'
+        :return: number of unread frames overwritten to make room
+        :raise queue.Full: no slot was freed in time
+        :raise ValueError: the frame does not fit into a slot
+        """
+        frame = item['frame']
+        if frame.nbytes > self.slot_size or frame.dtype != self.dtype:
+            raise ValueError('frame %s %s does not fit slot %s %s'
+                             % (frame.shape, frame.dtype,
+                                self.max_shape, self.dtype))
+        dropped = 0
+        if self.latest_wins:
+            slot, dropped = self._claim_slot(timeout)
+        else:
+            try:
+                slot = self._free_slots.get(block, timeout)
+            except queue.Empty:
+                raise queue.Full
+        self._slot_view(slot, frame.shape)[...] = frame
+        meta = {key: value for key, value in item.items() if key != 'frame'}
+        meta['slot'] = slot
+        meta['shape'] = frame.shape
+        self._items.put(meta)
+        return dropped
+
+    def _claim_slot(self, timeout=None):
+        """
+        :return: (slot, number of unread frames overwritten)
+        :raise queue.Full: nothing could be claimed in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # short blocking gets, a non blocking get misses items the queue
+            # feeder thread has not flushed yet
+            try:
+                return self._free_slots.get(True, 0.005), 0
+            except queue.Empty:
+                pass
+            try:
+                meta = self._items.get(True, 0.005)
+            except queue.Empty:
+                pass
+            else:
+                if meta is not None:
+                    return meta['slot'], 1
+                # a wake() sentinel, leave it for the reader
+                self._items.put(None)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise queue.Full
+
+    def get(self, block=True, timeout=None):
+        """
+        wait for the next frame, the previously returned slot is recycled
+        :return: dict, item metadata plus a zero-copy 'frame' view and the
+                 number of older frames 'skipped' to reach it, None after
+                 wake()
+        :raise queue.Empty: nothing arrived in time
+        """
+        self.release()
+        meta = self._items.get(block, timeout)
+        if meta is None:
+            return None
+        meta['skipped'] = 0
+        while self.latest_wins:
+            # jump to the newest frame, recycle the ones in between
+            try:
+                newer = self._items.get_nowait()
+            except queue.Empty:
+                break
+            if newer is None:
+                self._items.put(None)
+                break
+            self._free_slots.put(meta['slot'])
+            newer['skipped'] = meta['skipped'] + 1
+            meta = newer
+        self._held_slot = meta['slot']
+        meta['frame'] = self._slot_view(meta['slot'], meta['shape'])
+        return meta
+
+    def wake(self):
+        """make a blocked get() return None"""
+        self._items.put(None)
+
+    def release(self):
+        """hand the slot returned by the last get() back to the writer"""
+        if self._held_slot is not None:
+            self._free_slots.put(self._held_slot)
+            self._held_slot = None
+
+    def empty(self):
+        return self._items.empty()
+
+    def close(self):
+        for shm in self._shms:
+            shm.close()
+
+    def unlink(self):
+        for shm in self._shms:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
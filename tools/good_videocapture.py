@@ -3,22 +3,94 @@ import threading
 
 import cv2
 
+from monitor_logger.logger import get_logger
+
+
+logger = get_logger()
+
+__all__ = ['GoodVideoCpature',]
+
 
 class GoodVideoCpature(cv2.VideoCapture):
-    def __init__(self, url, timeout = 3, *args, **kwargs):
+    # seconds to wait after the first failed grab, doubled up to the maximum
+    FAILURE_BACKOFF = 0.05
+    MAX_FAILURE_BACKOFF = 1.0
+
+    def __init__(self, url, timeout = 3, decode_on_demand=False, *args, **kwargs):
         super(GoodVideoCpature, self).__init__(url, *args, **kwargs)
         self.frame_receiver = None
         self.timeout = timeout
-        self._result = (None, None)
+        # only grab() in the capture thread and retrieve() when asked
+        self.decode_on_demand = decode_on_demand
         self._reading = False
+        self._decode_requested = False
+        self._grabbed_num = 0
+        self._decoded_num = 0
+        # latest-frame slot, guarded by _frame_cond
+        self._frame_cond = threading.Condition()
+        self._frame = None
+        self._frame_seq = 0
+        self._frame_time = None
 
     @staticmethod
-    def create(url):
-        rtscap = GoodVideoCpature(url)
+    def create(url, decode_on_demand=False, profile=None):
+        rtscap = GoodVideoCpature(url, decode_on_demand=decode_on_demand)
+        if profile and rtscap.isOpened():
+            rtscap.apply_profile(profile)
         rtscap.frame_receiver = threading.Thread(target=rtscap.recv_frame)
         rtscap.frame_receiver.daemon = True
         return rtscap
 
+    def apply_profile(self, profile):
+        """
+        negotiate the capture format with the driver
+        :param profile: dict, optional keys: fourcc (e.g. 'MJPG'), width,
+                        height, fps, buffer_size, and cover_size with
+                        resolutions to pick the smallest (width, height)
+                        the driver grants that covers cover_size x cover_size
+        :return: dict, the settings the driver actually granted
+        """
+        if profile.get('fourcc'):
+            self.set(cv2.CAP_PROP_FOURCC,
+                     cv2.VideoWriter_fourcc(*profile['fourcc']))
+        if profile.get('cover_size'):
+            self._set_covering_resolution(profile['cover_size'],
+                                          profile.get('resolutions', ()))
+        elif profile.get('width') and profile.get('height'):
+            self.set(cv2.CAP_PROP_FRAME_WIDTH, profile['width'])
+            self.set(cv2.CAP_PROP_FRAME_HEIGHT, profile['height'])
+        if profile.get('fps'):
+            self.set(cv2.CAP_PROP_FPS, profile['fps'])
+        if profile.get('buffer_size'):
+            self.set(cv2.CAP_PROP_BUFFERSIZE, profile['buffer_size'])
+        granted = self.get_format()
+        logger.info('GoodVideoCpature.apply_profile: %s',
+                    'requested %s, granted %s' % (profile, granted))
+        return granted
+
+    def _set_covering_resolution(self, cover_size, resolutions):
+        granted = None
+        for width, height in sorted(resolutions, key=lambda r: r[0] * r[1]):
+            self.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            granted = (int(self.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                       int(self.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            if granted[0] >= cover_size and granted[1] >= cover_size:
+                return granted
+        logger.warning('GoodVideoCpature._set_covering_resolution: %s',
+                       'no mode covers %d, using %s' % (cover_size, granted))
+        return granted
+
+    def get_format(self):
+        fourcc = int(self.get(cv2.CAP_PROP_FOURCC))
+        return {
+            'fourcc': ''.join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)),
+            'width': int(self.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': self.get(cv2.CAP_PROP_FPS),
+            'buffer_size': int(self.get(cv2.CAP_PROP_BUFFERSIZE)),
+        }
+
     def is_started(self):
         ok = self.isOpened()
         if ok and self._reading:
@@ -28,25 +100,91 @@ class GoodVideoCpature(cv2.VideoCapture):
     def get_status(self):
         return self._reading
 
+    def get_frame_counters(self):
+        return {'grabbed': self._grabbed_num, 'decoded': self._decoded_num}
+
     def recv_frame(self):
+        failure_num = 0
         while self.isOpened():
             if not self._reading:
-                return
-            self._result = self.read()
+                break
+            if not self.grab():
+                failure_num += 1
+                self._wait_after_failure(failure_num)
+                continue
+            failure_num = 0
+            capture_time = time.monotonic()
+            self._grabbed_num += 1
+            if self.decode_on_demand and not self._decode_requested:
+                continue
+            retval, frame = self.retrieve()
+            if retval:
+                self._decoded_num += 1
+                self._publish_frame(frame, capture_time)
         self._reading = False
+        # wake up every waiter so nobody sleeps out the whole timeout
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def _wait_after_failure(self, failure_num):
+        """
+        an unplugged camera or an ended stream fails at once, wait with a
+        growing delay instead of spinning, interrupt() cuts the wait short
+        """
+        if failure_num == 1:
+            logger.warning('GoodVideoCpature.recv_frame: %s',
+                           'grab failed, retry with backoff')
+        delay = min(self.FAILURE_BACKOFF * 2 ** min(failure_num - 1, 8),
+                    self.MAX_FAILURE_BACKOFF)
+        with self._frame_cond:
+            if self._reading:
+                self._frame_cond.wait(delay)
+
+    def _publish_frame(self, frame, capture_time):
+        with self._frame_cond:
+            self._frame = frame
+            self._frame_time = capture_time
+            self._frame_seq += 1
+            self._decode_requested = False
+            self._frame_cond.notify_all()
+
+    def wait_for_frame(self, last_seq=0, timeout=None):
+        """
+        block until a frame newer than last_seq is published
+        :param last_seq: sequence number of the last frame the caller saw
+        :param timeout: seconds to wait, defaults to self.timeout
+        :return: (seq, frame, capture_time), frame is None on timeout
+        """
+        if timeout is None:
+            timeout = self.timeout
+        with self._frame_cond:
+            if self._frame_seq <= last_seq:
+                self._decode_requested = True
+            self._frame_cond.wait_for(
+                lambda: self._frame_seq > last_seq or not self._reading,
+                timeout)
+            if self._frame_seq <= last_seq:
+                return last_seq, None, None
+            return self._frame_seq, self._frame, self._frame_time
 
     def read_latest_frame(self):
-        start_time = time.time()
-        while not self._result[0] \
-              and (time.time() - start_time) <= self.timeout:
-              pass
-        return self._result
+        # without continuous decoding the slot may hold a stale frame
+        last_seq = self._frame_seq if self.decode_on_demand else 0
+        _, frame, _ = self.wait_for_frame(last_seq)
+        return frame is not None, frame
 
     def start_read(self):
         self._reading = True
         self.frame_receiver.start()
 
-    def stop_read(self):
+    def interrupt(self):
+        """stop the capture thread and wake every wait_for_frame caller"""
         self._reading = False
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def stop_read(self):
+        # also cuts short a backoff wait of the capture thread
+        self.interrupt()
         if self.frame_receiver.is_alive():
             self.frame_receiver.join()
@@ -7,3 +7,10 @@ def cv2base64(image):
     base64_str = cv2.imencode('.jpg', image)[1].tobytes()
     base64_str = base64.b64encode(base64_str)
     return base64_str.decode('utf8')
+
+
+def cv2jpeg(image):
+    """
+    :return: jpeg bytes of a bgr image, what cv2base64 encodes
+    """
+    return cv2.imencode('.jpg', image)[1].tobytes()
@@ -1,8 +1,22 @@
-from uuid import uuid4
+import os
+import gzip
+import copy
 import json
+import base64
 import datetime
+from uuid import uuid4
 
 import requests
+from urllib3.filepost import encode_multipart_formdata
+
+
+LABEL_STYLE = {'color': 'red'}
+INCIDENT_STYLE = {
+    "color": "red",
+    "stroke": {
+        "width": 2
+    }
+}
 
 
 class Text:
@@ -12,7 +26,7 @@ class Text:
                  value,
                  style=None):
         if style is None:
-            style = {'color': 'red'}
+            style = copy.deepcopy(LABEL_STYLE)
         self.key = key
         self.key_desc = key_desc
         self.value = value
@@ -44,12 +58,7 @@ class Location:
 class Incident:
     def __init__(self, location, label, style=None):
         if style is None:
-            style = {
-                "color": "red",
-                "stroke": {
-                    "width": 2
-                }
-            }
+            style = copy.deepcopy(INCIDENT_STYLE)
         self.location = location
         self.label = label
         self.style = style
@@ -68,6 +77,11 @@ class Incidents:
         self.incidents.append(incident.get_data())
         return self
 
+    def add_detections(self, result, label_key='failue', label_desc='置信度'):
+        """add every box of a tools.detection.DetectionResult"""
+        self.incidents.extend(result.to_incidents(label_key, label_desc))
+        return self
+
     def add_result(self, key, key_desc, value, style=None):
         result = Result(key, key_desc, value, style)
         self.results.append(result.get_data())
@@ -77,39 +91,131 @@ class Incidents:
         return self.__dict__
 
 
-def upload_incident(domain, incident_image, result):
+# 'json_base64' is the original wire format, a json body with the base64
+# jpeg and the result json encoded once more. 'multipart' sends the raw
+# jpeg next to a json part that can be gzipped.
+UPLOAD_FORMATS = ('json_base64', 'multipart')
+
+# keep-alive session of each process, see get_session
+_sessions = {}
+
+
+def get_session():
     """
-    传入域名和端口号，base64图片，分析结果上传服务器
-    :param domain: domain + 端口
-    :param incident_image: base64图片编码
+    :return: pooled requests.Session of the calling process, a session is
+             never shared with a forked child
+    """
+    pid = os.getpid()
+    if pid not in _sessions:
+        _sessions[pid] = requests.Session()
+    return _sessions[pid]
+
+
+def create_incident_payload(incident_image, result):
+    """
+    :param incident_image: jpeg bytes or base64图片编码
     :param result: json 参照README文件
-    :return: bool
+    :return: dict, encoded by encode_incident
+    """
+    return {
+        'incident_id': str(uuid4()),
+        'incident_image': incident_image,
+        'response': result,
+        'occurence_time': datetime.datetime.now().__str__()
+    }
+
+
+def encode_incident(payload, upload_format='json_base64', gzip_json=False):
+    """
+    :param payload: dict from create_incident_payload
+    :param upload_format: one of UPLOAD_FORMATS
+    :param gzip_json: gzip the json part of a multipart upload
+    :return: (body bytes, content type)
+    """
+    image = payload['incident_image']
+    response = payload['response']
+    if upload_format == 'json_base64':
+        if isinstance(image, bytes):
+            image = base64.b64encode(image).decode('utf8')
+        if not isinstance(response, str):
+            response = json.dumps(response)
+        body = dict(payload, incident_image=image, response=response)
+        return json.dumps(body).encode('utf8'), 'application/json'
+    if upload_format != 'multipart':
+        raise ValueError('upload_format must be one of %s' % (UPLOAD_FORMATS,))
+    if isinstance(image, str):
+        image = base64.b64decode(image)
+    if isinstance(response, str):
+        response = json.loads(response)
+    incident = {key: value for key, value in payload.items()
+                if key != 'incident_image'}
+    incident['response'] = response
+    incident = json.dumps(incident).encode('utf8')
+    if gzip_json:
+        incident = ('incident.json.gz', gzip.compress(incident), 'application/gzip')
+    else:
+        incident = ('incident.json', incident, 'application/json')
+    return encode_multipart_formdata({
+        'incident': incident,
+        'incident_image': ('incident.jpg', image, 'image/jpeg')
+    })
+
+
+def post_incident(domain,
+                  payload,
+                  timeout=100,
+                  upload_format='json_base64',
+                  gzip_json=False,
+                  session=None):
+    """
+    :param domain: domain + 端口
+    :param payload: dict from create_incident_payload
+    :param timeout: seconds, or a (connect, read) tuple
+    :param upload_format: see encode_incident
+    :param gzip_json: see encode_incident
+    :param session: requests.Session, get_session() if None
+    :return: True if the server accepted the incident, False if it
+             rejected it, None if it could not be reached or failed
+             and the upload is worth retrying
     """
     url = 'http://' + domain + '/incidents/create-incident'
+    body, content_type = encode_incident(payload, upload_format, gzip_json)
+    if session is None:
+        session = get_session()
     try:
-        response = requests.post(
+        response = session.post(
             url=url,
-            json={
-                'incident_id': str(uuid4()),
-                'incident_image': incident_image,
-                'response': json.dumps(result),
-                'occurence_time': datetime.datetime.now().__str__()
-            },
+            data=body,
             headers={
-                'Content-Type': 'application/json'
+                'Content-Type': content_type
             },
-            timeout=100
+            timeout=timeout
         )
-    except (
-        requests.exceptions.ConnectTimeout,
-        requests.exceptions.ConnectionError,
-        requests.exceptions.ReadTimeout,
-        requests.exceptions.RetryError):
+    except requests.exceptions.RequestException:
+        return None
+
+    if response.status_code != 200:
+        return None if response.status_code >= 500 else False
+    try:
+        return bool(response.json()['code'])
+    except (ValueError, KeyError, TypeError):
         return False
 
-    if response.status_code == 200:
-        response = response.json()
-        if response['code']:
-            return True
 
-    return False
+def upload_incident(domain,
+                    incident_image,
+                    result,
+                    upload_format='json_base64',
+                    gzip_json=False):
+    """
+    传入域名和端口号，base64图片，分析结果上传服务器
+    :param domain: domain + 端口
+    :param incident_image: jpeg bytes or base64图片编码
+    :param result: json 参照README文件
+    :param upload_format: see encode_incident
+    :param gzip_json: see encode_incident
+    :return: bool
+    """
+    payload = create_incident_payload(incident_image, result)
+    return bool(post_incident(domain, payload, upload_format=upload_format,
+                              gzip_json=gzip_json))
@@ -3,6 +3,24 @@ import numpy as np
 from PIL import Image
 
 
+# op type name -> op class, filled by register_preprocess_op
+PREPROCESS_OPS = {}
+
+
+def register_preprocess_op(cls):
+    PREPROCESS_OPS[cls.__name__] = cls
+    return cls
+
+
+def _as_op_list(preprocess_infos):
+    """turn {op_type: op_info} into the infer_cfg.yml [{'type': ...}] form"""
+    if isinstance(preprocess_infos, dict):
+        return [dict(op_info, type=op_type)
+                for op_type, op_info in preprocess_infos.items()]
+    return [dict(op_info) for op_info in preprocess_infos]
+
+
+@register_preprocess_op
 class Resize(object):
     """resize image by target_size and max_size
     Args:
@@ -28,6 +46,8 @@ class Resize(object):
         self.use_cv2 = use_cv2
         self.interp = interp
         self.scale_set = {'RCNN', 'RetinaNet', 'FCOS'}
+        # origin shape -> (im_scale_x, im_scale_y)
+        self._scale_cache = {}
 
     def __call__(self, im, im_info):
         """
@@ -81,6 +101,8 @@ class Resize(object):
             im_scale_y: the resize ratio of Y
         """
         origin_shape = im.shape[:2]
+        if origin_shape in self._scale_cache:
+            return self._scale_cache[origin_shape]
         # im_c = im.shape[2]
         if self.max_size != 0 and self.arch in self.scale_set:
             im_size_min = np.min(origin_shape[0:2])
@@ -93,9 +115,11 @@ class Resize(object):
         else:
             im_scale_x = float(self.target_size) / float(origin_shape[1])
             im_scale_y = float(self.target_size) / float(origin_shape[0])
+        self._scale_cache[origin_shape] = (im_scale_x, im_scale_y)
         return im_scale_x, im_scale_y
 
 
+@register_preprocess_op
 class Normalize(object):
     """normalize image
     Args:
@@ -110,6 +134,12 @@ class Normalize(object):
         self.std = std
         self.is_scale = is_scale
         self.is_channel_first = is_channel_first
+        if self.is_channel_first:
+            self._mean = np.array(self.mean)[:, np.newaxis, np.newaxis]
+            self._std = np.array(self.std)[:, np.newaxis, np.newaxis]
+        else:
+            self._mean = np.array(self.mean)[np.newaxis, np.newaxis, :]
+            self._std = np.array(self.std)[np.newaxis, np.newaxis, :]
 
     def __call__(self, im, im_info):
         """
@@ -121,19 +151,14 @@ class Normalize(object):
             im_info (dict): info of processed image
         """
         im = im.astype(np.float32, copy=False)
-        if self.is_channel_first:
-            mean = np.array(self.mean)[:, np.newaxis, np.newaxis]
-            std = np.array(self.std)[:, np.newaxis, np.newaxis]
-        else:
-            mean = np.array(self.mean)[np.newaxis, np.newaxis, :]
-            std = np.array(self.std)[np.newaxis, np.newaxis, :]
         if self.is_scale:
             im = im / 255.0
-        im -= mean
-        im /= std
+        im -= self._mean
+        im /= self._std
         return im, im_info
 
 
+@register_preprocess_op
 class Permute(object):
     """permute image
     Args:
@@ -161,6 +186,7 @@ class Permute(object):
         return im, im_info
 
 
+@register_preprocess_op
 class PadStride(object):
     """ padding image for model with FPN
     Args:
@@ -181,7 +207,7 @@ class PadStride(object):
         """
         coarsest_stride = self.coarsest_stride
         if coarsest_stride == 0:
-            return im
+            return im, im_info
         im_c, im_h, im_w = im.shape
         pad_h = int(np.ceil(float(im_h) / coarsest_stride) * coarsest_stride)
         pad_w = int(np.ceil(float(im_w) / coarsest_stride) * coarsest_stride)
@@ -189,3 +215,197 @@ class PadStride(object):
         padding_im[:, :im_h, :im_w] = im
         im_info['resize_shape'] = padding_im.shape[1:]
         return padding_im, im_info
+
+
+class FusedPreprocess(object):
+    """resize, channel swap, scaling, normalization and HWC->CHW fused into
+    a lookup table pass, written into a reusable NCHW float32 buffer
+    Args:
+        preprocess_infos (dict/list): configs.IMAGE_PREPROCESS_PARAM style
+            {op_type: op_info} or the infer_cfg.yml Preprocess list
+        from_bgr (bool): whether the input frames are BGR, as read by cv2
+    Raises:
+        ValueError: the op chain can not be fused
+    """
+
+    def __init__(self, preprocess_infos, from_bgr=True):
+        ops = {}
+        for op_info in _as_op_list(preprocess_infos):
+            ops[op_info.pop('type')] = op_info
+        unknown = set(ops) - {'Resize', 'Normalize', 'Permute', 'PadStride'}
+        if unknown:
+            raise ValueError('can not fuse ops: {}'.format(sorted(unknown)))
+        resize = ops.get('Resize')
+        if resize is None or resize.get('max_size', 0) != 0 \
+                or not resize.get('use_cv2', True):
+            raise ValueError('can only fuse a cv2 Resize without max_size')
+        if ops.get('PadStride', {}).get('stride', 0):
+            raise ValueError('can not fuse PadStride with stride > 0')
+        permute = ops.get('Permute', {})
+        if not permute.get('channel_first', True):
+            raise ValueError('can only fuse a channel first layout')
+        self.target_size = resize['target_size']
+        self.interp = resize.get('interp', cv2.INTER_LINEAR)
+
+        normalize = ops.get('Normalize')
+        if normalize is not None:
+            mean = np.array(normalize['mean'], dtype=np.float64)
+            std = np.array(normalize['std'], dtype=np.float64)
+            scale = 255.0 if normalize.get('is_scale', True) else 1.0
+        else:
+            mean, std, scale = np.zeros(3), np.ones(3), 1.0
+        # output channel c reads input channel src_channels[c]
+        to_rgb = from_bgr != permute.get('to_bgr', False)
+        self.src_channels = [2, 1, 0] if to_rgb else [0, 1, 2]
+        # lookup table indexed by input channel: uint8 -> normalized float
+        values = np.arange(256, dtype=np.float64)[:, np.newaxis]
+        lut = (values / scale - mean) / std
+        self.lut = np.empty((1, 256, 3), dtype=np.float32)
+        self.lut[0][:, self.src_channels] = lut
+        # origin shape -> (scale, resize shape, buffers)
+        self._shape_cache = {}
+
+    def _specialize(self, origin_shape):
+        origin_h, origin_w = origin_shape
+        im_scale_x = float(self.target_size) / float(origin_w)
+        im_scale_y = float(self.target_size) / float(origin_h)
+        resize_h = int(round(origin_h * im_scale_y))
+        resize_w = int(round(origin_w * im_scale_x))
+        return {
+            'scale': [im_scale_x, im_scale_y],
+            'resize_shape': (resize_h, resize_w),
+            'resized': np.empty((resize_h, resize_w, 3), dtype=np.uint8),
+            'normalized': np.empty((resize_h, resize_w, 3), dtype=np.float32),
+            'buffer': np.empty((1, 3, resize_h, resize_w), dtype=np.float32),
+        }
+
+    def __call__(self, im):
+        """
+        Args:
+            im (np.ndarray): HWC uint8 image
+        Returns:
+            im (np.ndarray): 1xCxHxW float32, reused by the next call
+            im_info (dict): info of processed image
+        """
+        origin_shape = im.shape[:2]
+        spec = self._shape_cache.get(origin_shape)
+        if spec is None:
+            spec = self._shape_cache[origin_shape] = self._specialize(origin_shape)
+        resize_h, resize_w = spec['resize_shape']
+        cv2.resize(im, (resize_w, resize_h), dst=spec['resized'],
+                   interpolation=self.interp)
+        cv2.LUT(spec['resized'], self.lut, dst=spec['normalized'])
+        for c, src in enumerate(self.src_channels):
+            np.copyto(spec['buffer'][0, c], spec['normalized'][:, :, src])
+        im_info = {
+            'scale': list(spec['scale']),
+            'origin_shape': origin_shape,
+            'resize_shape': spec['resize_shape'],
+        }
+        return spec['buffer'], im_info
+
+
+class PreprocessPipeline(object):
+    """preprocessing ops compiled once from their config, runs the fused
+    path when the op chain allows it and the registered ops otherwise
+    Args:
+        preprocess_infos (dict/list): configs.IMAGE_PREPROCESS_PARAM style
+            {op_type: op_info} or the infer_cfg.yml Preprocess list
+        arch (str): model type, passed on to Resize
+        from_bgr (bool): whether frames should be converted BGR -> RGB first
+        fuse (bool): whether to try FusedPreprocess
+    Raises:
+        ValueError: unknown op type
+    """
+
+    def __init__(self, preprocess_infos, arch=None, from_bgr=True, fuse=True):
+        self.preprocess_infos = _as_op_list(preprocess_infos)
+        self.arch = arch
+        self.from_bgr = from_bgr
+        self.fuse = fuse
+        # target size -> PreprocessPipeline, see for_target_size
+        self._variants = {}
+        self.ops = []
+        for op_info in _as_op_list(preprocess_infos):
+            op_type = op_info.pop('type')
+            if op_type not in PREPROCESS_OPS:
+                raise ValueError('Unknown preprocess op: {}, expect {}'.format(
+                    op_type, sorted(PREPROCESS_OPS)))
+            if op_type == 'Resize' and arch is not None:
+                op_info['arch'] = arch
+            self.ops.append(PREPROCESS_OPS[op_type](**op_info))
+        self.fused = None
+        # (batch size, C, H, W) -> reused batch buffer
+        self._batch_buffers = {}
+        if fuse:
+            try:
+                self.fused = FusedPreprocess(preprocess_infos, from_bgr)
+            except ValueError:
+                pass
+
+    def for_target_size(self, target_size):
+        """
+        Args:
+            target_size (int): Resize target size of the variant
+        Returns:
+            PreprocessPipeline: same ops resizing to target_size, cached
+        """
+        if target_size not in self._variants:
+            preprocess_infos = []
+            for op_info in self.preprocess_infos:
+                op_info = dict(op_info)
+                if op_info['type'] == 'Resize':
+                    op_info['target_size'] = target_size
+                    if op_info.get('image_shape'):
+                        op_info['image_shape'] = [target_size, target_size]
+                preprocess_infos.append(op_info)
+            self._variants[target_size] = PreprocessPipeline(
+                preprocess_infos, self.arch, self.from_bgr, self.fuse)
+        return self._variants[target_size]
+
+    def apply_ops(self, im, im_info):
+        for operator in self.ops:
+            im, im_info = operator(im, im_info)
+        return im, im_info
+
+    def __call__(self, im):
+        """
+        Args:
+            im (np.ndarray): HWC uint8 frame read by cv2
+        Returns:
+            im (np.ndarray): 1xCxHxW float32, the fused buffer is reused
+                             by the next call
+            im_info (dict): info of processed image
+        """
+        if self.fused is not None:
+            return self.fused(im)
+        im_info = {
+            'scale': [1., 1.],
+            'origin_shape': im.shape[:2],
+            'resize_shape': im.shape[:2],
+        }
+        if self.from_bgr:
+            im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+        im, im_info = self.apply_ops(im, im_info)
+        return np.ascontiguousarray(im[np.newaxis], dtype=np.float32), im_info
+
+    def batch(self, ims):
+        """
+        Args:
+            ims (list): HWC uint8 frames read by cv2, every frame has to
+                        come out of the ops with the same shape
+        Returns:
+            im (np.ndarray): NxCxHxW float32, reused by the next call
+            im_infos (list): info of each processed image
+        """
+        batch_im, im_infos = None, []
+        for i, im in enumerate(ims):
+            im, im_info = self(im)
+            if batch_im is None:
+                shape = (len(ims),) + im.shape[1:]
+                if shape not in self._batch_buffers:
+                    self._batch_buffers[shape] = np.empty(shape, dtype=np.float32)
+                batch_im = self._batch_buffers[shape]
+            batch_im[i] = im[0]
+            im_infos.append(im_info)
+        return batch_im, im_infos
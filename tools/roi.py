@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+from .detection import DetectionResult
+
+
+__all__ = ['RegionOfInterest', 'ROIDetector',]
+
+
+class RegionOfInterest:
+    """
+    region of the camera frame the detector looks at, usually the print bed
+    Args:
+        rect (list): [x_min, y_min, x_max, y_max] in frame pixels, the crop
+                     is a zero-copy slice of the frame
+        polygon (list): [[x, y], ...] in frame pixels, the frame is cropped
+                        to its bounding rect and pixels outside are blacked
+    """
+
+    def __init__(self, rect=None, polygon=None):
+        if rect is None and polygon is None:
+            raise ValueError('RegionOfInterest needs a rect or a polygon')
+        self.polygon = None
+        if polygon is not None:
+            self.polygon = np.array(polygon, dtype=np.int32).reshape(-1, 2)
+            x_min, y_min = self.polygon.min(axis=0)
+            x_max, y_max = self.polygon.max(axis=0) + 1
+            rect = [x_min, y_min, x_max, y_max]
+        self.rect = [int(v) for v in rect]
+        # frame shape -> (slices, offset, mask)
+        self._shape_cache = {}
+
+    def _specialize(self, frame_shape):
+        height, width = frame_shape[:2]
+        x_min, y_min, x_max, y_max = self.rect
+        x_min, x_max = np.clip([x_min, x_max], 0, width).tolist()
+        y_min, y_max = np.clip([y_min, y_max], 0, height).tolist()
+        mask = None
+        if self.polygon is not None:
+            mask = np.zeros((y_max - y_min, x_max - x_min), dtype=np.uint8)
+            cv2.fillPoly(mask, [self.polygon - [x_min, y_min]], 1)
+            mask = mask.astype(bool)
+        return (slice(y_min, y_max), slice(x_min, x_max)), (x_min, y_min), mask
+
+    def crop(self, frame):
+        """
+        :param frame: ndarray
+        :return: (crop, (x_offset, y_offset))
+        """
+        spec = self._shape_cache.get(frame.shape)
+        if spec is None:
+            spec = self._shape_cache[frame.shape] = self._specialize(frame.shape)
+        slices, offset, mask = spec
+        crop = frame[slices]
+        if mask is not None:
+            crop = crop.copy()
+            crop[~mask] = 0
+        return crop, offset
+
+    @staticmethod
+    def to_frame(result, offset):
+        """translate a DetectionResult of the crop back to frame coordinates"""
+        if not result.num:
+            return result
+        boxes = result.boxes.copy()
+        boxes[:, [2, 4]] += offset[0]
+        boxes[:, [3, 5]] += offset[1]
+        return DetectionResult(boxes, result.masks)
+
+
+class ROIDetector:
+    """
+    runs a Detector on the region of interest only, the result is in
+    frame coordinates
+    Args:
+        detector: infers Detector, TiledDetector, ...
+        roi (RegionOfInterest): region to crop
+    """
+
+    def __init__(self, detector, roi):
+        self.detector = detector
+        self.roi = roi
+
+    def predict(self, image, **kwargs):
+        crop, offset = self.roi.crop(image)
+        return self.roi.to_frame(self.detector.predict(crop, **kwargs), offset)
+
+    def predict_batch(self, images, **kwargs):
+        crops, offsets = zip(*[self.roi.crop(image) for image in images])
+        results = self.detector.predict_batch(list(crops), **kwargs)
+        return [self.roi.to_frame(result, offset)
+                for result, offset in zip(results, offsets)]
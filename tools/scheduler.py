@@ -0,0 +1,42 @@
+__all__ = ['InspectionScheduler', 'HINT_CLEAR', 'HINT_SUSPICIOUS', 'HINT_ALARM',
+           'HINT_STOP',]
+
+
+# scheduling hints the handler sends back to the detector
+HINT_CLEAR = 'clear'
+HINT_SUSPICIOUS = 'suspicious'
+HINT_ALARM = 'alarm'
+# wakes the detector up when the monitor stops
+HINT_STOP = 'stop'
+
+
+class InspectionScheduler:
+    """
+    adaptive inspection interval: backs off towards max_interval while
+    inspections are clear and tightens towards min_interval when boxes show up
+    Args:
+        min_interval (float): seconds
+        max_interval (float): seconds, also the starting interval
+        backoff (float): interval multiplier after a clear inspection
+        tighten (float): interval multiplier after a suspicious inspection
+    """
+
+    def __init__(self, min_interval, max_interval, backoff=2.0, tighten=0.25):
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.tighten = tighten
+        self.interval = max_interval
+
+    def update(self, hint):
+        """
+        :param hint: HINT_CLEAR, HINT_SUSPICIOUS or HINT_ALARM
+        :return: the new interval in seconds
+        """
+        if hint == HINT_ALARM:
+            self.interval = self.min_interval
+        elif hint == HINT_SUSPICIOUS:
+            self.interval = max(self.interval * self.tighten, self.min_interval)
+        elif hint == HINT_CLEAR:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+from .detection import DetectionResult
+
+
+__all__ = ['make_tiles', 'nms', 'TiledDetector',]
+
+
+def _tile_starts(length, tile_size, overlap):
+    if length <= tile_size:
+        return [0]
+    stride = max(int(tile_size * (1. - overlap)), 1)
+    num = math.ceil((length - tile_size) / stride) + 1
+    return np.linspace(0, length - tile_size, num).round().astype(int).tolist()
+
+
+def make_tiles(frame_shape, tile_size=608, overlap=0.2, max_tiles=6):
+    """
+    cut a frame into overlapping tiles
+    :param frame_shape: (h, w, ...) of the frame
+    :param tile_size: side of a tile in frame pixels
+    :param overlap: fraction of a tile shared with its neighbour
+    :param max_tiles: tile budget, tiles grow until the grid fits in it
+    :return: list of (x_min, y_min, x_max, y_max)
+    """
+    height, width = frame_shape[:2]
+    while True:
+        xs = _tile_starts(width, tile_size, overlap)
+        ys = _tile_starts(height, tile_size, overlap)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        tile_size = int(tile_size * 1.25) + 1
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in ys for x in xs]
+
+
+def nms(boxes, iou_threshold=0.5):
+    """
+    class aware non maximum suppression
+    :param boxes: [N, 6] rows of [class, score, x_min, y_min, x_max, y_max]
+    :param iou_threshold: boxes overlapping a better one above it are dropped
+    :return: the kept rows, sorted by score
+    """
+    if len(boxes) == 0:
+        return boxes
+    boxes = boxes[np.argsort(-boxes[:, 1], kind='stable')]
+    # shift every class into its own coordinate range
+    offset = boxes[:, 0:1] * (boxes[:, 2:].max() + 1)
+    xyxy = boxes[:, 2:] + offset
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    inter_w = np.clip(np.minimum(xyxy[:, None, 2], xyxy[None, :, 2])
+                      - np.maximum(xyxy[:, None, 0], xyxy[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(xyxy[:, None, 3], xyxy[None, :, 3])
+                      - np.maximum(xyxy[:, None, 1], xyxy[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    iou = inter / np.maximum(areas[:, None] + areas[None, :] - inter, 1e-9)
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            keep[i + 1:] &= iou[i, i + 1:] <= iou_threshold
+    return boxes[keep]
+
+
+class TiledDetector:
+    """
+    runs a Detector on overlapping tiles of the frame as one batch and
+    merges the boxes back in frame coordinates
+    Args:
+        detector: infers Detector with predict_batch
+        tile_size (int): side of a tile in frame pixels
+        overlap (float): fraction of a tile shared with its neighbour
+        max_tiles (int): tile budget per frame, the whole frame tile
+                         included
+        nms_threshold (float): iou above which cross tile boxes are merged
+        include_full_frame (bool): also run the whole frame, keeps the
+                                   objects larger than a tile
+    """
+
+    def __init__(self,
+                 detector,
+                 tile_size=608,
+                 overlap=0.2,
+                 max_tiles=6,
+                 nms_threshold=0.5,
+                 include_full_frame=True):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.nms_threshold = nms_threshold
+        self.include_full_frame = include_full_frame
+        # frame shape -> tiles
+        self._tiles_cache = {}
+
+    def get_tiles(self, frame_shape):
+        frame_shape = tuple(frame_shape[:2])
+        if frame_shape not in self._tiles_cache:
+            max_tiles = self.max_tiles
+            if self.include_full_frame:
+                # leave room for the whole frame tile, a single grid tile
+                # is the whole frame already
+                max_tiles = max(max_tiles - 1, 1)
+            tiles = make_tiles(frame_shape, self.tile_size,
+                               self.overlap, max_tiles)
+            if self.include_full_frame and len(tiles) > 1:
+                tiles.append((0, 0, frame_shape[1], frame_shape[0]))
+            self._tiles_cache[frame_shape] = tiles
+        return self._tiles_cache[frame_shape]
+
+    def predict(self, image, **kwargs):
+        """
+        :param image: ndarray
+        :return: DetectionResult in frame coordinates
+        """
+        tiles = self.get_tiles(image.shape)
+        crops = [image[y_min:y_max, x_min:x_max]
+                 for x_min, y_min, x_max, y_max in tiles]
+        results = self.detector.predict_batch(crops, **kwargs)
+        boxes = []
+        for (x_min, y_min, _, _), result in zip(tiles, results):
+            if result.num:
+                tile_boxes = result.boxes.copy()
+                tile_boxes[:, [2, 4]] += x_min
+                tile_boxes[:, [3, 5]] += y_min
+                boxes.append(tile_boxes)
+        if not boxes:
+            return DetectionResult()
+        return DetectionResult(nms(np.concatenate(boxes), self.nms_threshold))
+
+    def predict_batch(self, images, **kwargs):
+        """every frame is already a batch of tiles, run them one by one"""
+        return [self.predict(image, **kwargs) for image in images]
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+__all__ = ['box_iou', 'BoxTracker',]
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    :param boxes_a: [N, 4] xyxy
+    :param boxes_b: [M, 4] xyxy
+    :return: [N, M] iou matrix
+    """
+    inter_w = np.clip(np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+                      - np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0]),
+                      0, None)
+    inter_h = np.clip(np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+                      - np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1]),
+                      0, None)
+    inter = inter_w * inter_h
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class BoxTracker:
+    """
+    iou tracker over consecutive detections. The state of all tracks lives
+    in a few parallel arrays, one row per track.
+    A track is confirmed once it has been seen min_age times, its area grew
+    by at least min_growth and its mean score is at least min_score.
+    Args:
+        iou_threshold (float): iou a detection needs to continue a track
+        max_missed (int): frames a track survives without a detection
+        min_age (int): detections before a track can be confirmed
+        min_growth (float): last area / first area a track needs
+        min_score (float): mean score over the history a track needs
+        history (int): number of scores kept per track
+    """
+
+    def __init__(self,
+                 iou_threshold=0.3,
+                 max_missed=1,
+                 min_age=2,
+                 min_growth=1.0,
+                 min_score=0.1,
+                 history=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_age = min_age
+        self.min_growth = min_growth
+        self.min_score = min_score
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), dtype=np.float64)
+        self.clsids = np.zeros(0, dtype=np.int32)
+        self.ages = np.zeros(0, dtype=np.int32)
+        self.missed = np.zeros(0, dtype=np.int32)
+        self.first_areas = np.zeros(0, dtype=np.float64)
+        self.areas = np.zeros(0, dtype=np.float64)
+        # rolling score history, nan where a track has fewer scores
+        self.scores = np.zeros((0, self.history), dtype=np.float64)
+
+    @property
+    def num(self):
+        return len(self.boxes)
+
+    @staticmethod
+    def _areas(boxes):
+        return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    def _match(self, det_boxes, det_clsids):
+        """greedy matching by descending iou, within the same class"""
+        iou = box_iou(self.boxes, det_boxes)
+        iou[self.clsids[:, None] != det_clsids[None, :]] = 0
+        track_idx, det_idx = [], []
+        while iou.size:
+            track, det = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[track, det] < self.iou_threshold:
+                break
+            track_idx.append(track)
+            det_idx.append(det)
+            iou[track, :] = -1
+            iou[:, det] = -1
+        return np.array(track_idx, dtype=int), np.array(det_idx, dtype=int)
+
+    def update(self, result):
+        """
+        :param result: DetectionResult of the next frame
+        :return: number of confirmed tracks
+        """
+        det_boxes = result.xyxy
+        det_scores = result.scores
+        det_clsids = result.clsids
+        track_idx, det_idx = self._match(det_boxes, det_clsids)
+
+        self.missed += 1
+        self.missed[track_idx] = 0
+        self.ages[track_idx] += 1
+        self.boxes[track_idx] = det_boxes[det_idx]
+        self.areas[track_idx] = self._areas(det_boxes[det_idx])
+        self.scores[track_idx] = np.roll(self.scores[track_idx], -1, axis=1)
+        self.scores[track_idx, -1] = det_scores[det_idx]
+
+        alive = self.missed <= self.max_missed
+        new = np.ones(len(det_boxes), dtype=bool)
+        new[det_idx] = False
+        new_scores = np.full((new.sum(), self.history), np.nan)
+        new_scores[:, -1] = det_scores[new]
+        new_areas = self._areas(det_boxes[new])
+        self.boxes = np.concatenate([self.boxes[alive], det_boxes[new]])
+        self.clsids = np.concatenate([self.clsids[alive], det_clsids[new]])
+        self.ages = np.concatenate([self.ages[alive], np.ones(new.sum(), dtype=np.int32)])
+        self.missed = np.concatenate([self.missed[alive], np.zeros(new.sum(), dtype=np.int32)])
+        self.first_areas = np.concatenate([self.first_areas[alive], new_areas])
+        self.areas = np.concatenate([self.areas[alive], new_areas])
+        self.scores = np.concatenate([self.scores[alive], new_scores])
+        return self.confirmed_num()
+
+    def confirmed(self):
+        """
+        :return: bool mask of the confirmed tracks
+        """
+        if not self.num:
+            return np.zeros(0, dtype=bool)
+        growth = self.areas / np.maximum(self.first_areas, 1e-9)
+        mean_scores = np.nanmean(self.scores, axis=1)
+        return ((self.ages >= self.min_age)
+                & (self.missed == 0)
+                & (growth >= self.min_growth)
+                & (mean_scores >= self.min_score))
+
+    def confirmed_num(self):
+        return int(self.confirmed().sum())
@@ -0,0 +1,328 @@
+import os
+import json
+import base64
+import time
+import fcntl
+import queue
+import threading
+
+import requests
+
+from monitor_logger.logger import get_logger
+from .incidents import create_incident_payload, post_incident
+
+logger = get_logger()
+
+
+__all__ = ['IncidentSpool', 'IncidentUploader',]
+
+
+class IncidentSpool:
+    """
+    append-only json lines file of incidents waiting for upload. Entries
+    are consumed from the front by advancing an offset kept next to the
+    file, the file is removed once every entry is consumed. Every
+    operation holds an flock, so monitors in several processes can share
+    one spool; an entry may then be sent twice but never lost.
+    Args:
+        path (str): spool file
+        max_bytes (int): the oldest entries are evicted beyond this size
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evicted_num = 0
+        self._offset_path = path + '.offset'
+        self._lock_path = path + '.lock'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _locked(self):
+        lock = open(self._lock_path, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _read_offset(self):
+        try:
+            with open(self._offset_path) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        tmp_path = self._offset_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self._offset_path)
+
+    def _remove(self):
+        for path in (self.path, self._offset_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def pending_bytes(self):
+        with self._locked():
+            return max(self._size() - self._read_offset(), 0)
+
+    def append(self, payload):
+        """
+        :param payload: dict from create_incident_payload, a jpeg image
+                        is stored base64 encoded
+        :return: False if the entry alone is larger than max_bytes
+        """
+        if isinstance(payload['incident_image'], bytes):
+            payload = dict(payload, incident_image=base64.b64encode(
+                payload['incident_image']).decode('utf8'))
+        line = (json.dumps(payload) + '\n').encode('utf8')
+        if len(line) > self.max_bytes:
+            self.evicted_num += 1
+            logger.error('IncidentSpool.append: %s',
+                         'incident of %d bytes exceeds the spool size'
+                         % len(line))
+            return False
+        with self._locked():
+            pending = self._size() - self._read_offset()
+            if pending + len(line) > self.max_bytes:
+                self._evict(self.max_bytes - len(line))
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return True
+
+    def _evict(self, keep_bytes):
+        """drop the oldest entries until at most keep_bytes are left"""
+        with open(self.path, 'rb') as f:
+            f.seek(self._read_offset())
+            lines = f.readlines()
+        size = sum(len(line) for line in lines)
+        dropped = 0
+        while dropped < len(lines) and size > keep_bytes:
+            size -= len(lines[dropped])
+            dropped += 1
+        lines = lines[dropped:]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._write_offset(0)
+        self.evicted_num += dropped
+        logger.warning('IncidentSpool._evict: %s',
+                       'spool full, evicted the %d oldest incidents' % dropped)
+
+    def peek(self):
+        """
+        :return: (payload, offset) of the oldest entry, None if empty.
+                 Pass the offset and the incident_id to pop() once the
+                 entry is uploaded.
+        """
+        with self._locked():
+            offset = self._read_offset()
+            if offset >= self._size():
+                return None
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                line = f.readline()
+            try:
+                return json.loads(line.decode('utf8')), offset
+            except ValueError:
+                # a torn write, e.g. power loss while appending
+                logger.error('IncidentSpool.peek: %s',
+                             'skip a corrupt entry at offset %d' % offset)
+                self._advance(offset, offset + len(line))
+        return self.peek()
+
+    def pop(self, offset, incident_id):
+        """
+        consume the entry at offset, a no-op if someone else already did.
+        An eviction rewrites the file from offset 0, so the entry found at
+        offset has to be the peeked incident too.
+        """
+        with self._locked():
+            if self._read_offset() != offset:
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                line = f.readline()
+            try:
+                if json.loads(line.decode('utf8'))['incident_id'] != incident_id:
+                    return
+            except (ValueError, KeyError, TypeError):
+                # peek() skips a corrupt entry
+                return
+            self._advance(offset, offset + len(line))
+
+    def _advance(self, offset, next_offset):
+        if next_offset >= self._size():
+            self._remove()
+        else:
+            self._write_offset(next_offset)
+
+
+class IncidentUploader:
+    """
+    uploads incidents from a background thread. submit() never blocks:
+    incidents go to a bounded in-memory queue and spill to an IncidentSpool
+    when the queue is full, when the server can't be reached or on close().
+    Failed uploads are retried with exponential backoff, spooled incidents
+    are sent oldest first whenever the queue is empty.
+    Args:
+        domain (str): domain + port of the incident server
+        spool_path (str): see IncidentSpool
+        queue_size (int): incidents kept in memory
+        max_spool_bytes (int): see IncidentSpool
+        timeout (tuple): (connect, read) seconds of a single upload
+        backoff (float): seconds to wait after the first failure, doubled
+                         after each further failure
+        max_backoff (float): upper bound of the wait
+        upload_format (str): see tools.incidents.encode_incident
+        gzip_json (bool): see tools.incidents.encode_incident
+    """
+
+    def __init__(self,
+                 domain,
+                 spool_path,
+                 queue_size=16,
+                 max_spool_bytes=50 * 1024 * 1024,
+                 timeout=(3.05, 30),
+                 backoff=1.0,
+                 max_backoff=300.0,
+                 upload_format='json_base64',
+                 gzip_json=False):
+        self.domain = domain
+        self.timeout = tuple(timeout)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.upload_format = upload_format
+        self.gzip_json = gzip_json
+        # keep-alive connection, only used by the upload thread
+        self._session = requests.Session()
+        self.spool = IncidentSpool(spool_path, max_spool_bytes)
+        self.uploaded_num = 0
+        self.rejected_num = 0
+        self.retry_num = 0
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._in_flight = None
+        self._failures = 0
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, incident_image, result):
+        """
+        queue an incident, never waits on the network or a full queue
+        :param incident_image: jpeg bytes or base64图片编码
+        :param result: json 参照README文件
+        """
+        payload = create_incident_payload(incident_image, result)
+        if self._closed.is_set():
+            self.spool.append(payload)
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            logger.warning('IncidentUploader.submit: %s',
+                           'queue full, spool incident %s'
+                           % payload['incident_id'])
+            self.spool.append(payload)
+
+    def close(self):
+        """
+        stop the upload thread, never waits on the network. Queued and
+        in-flight incidents are spooled for the next uploader; an incident
+        in flight may then be sent twice.
+        """
+        with self._lock:
+            self._closed.set()
+        self._spool_pending()
+
+    def _spool_pending(self):
+        """move the in-flight and the queued incidents to the spool"""
+        with self._lock:
+            pending = [] if self._in_flight is None else [self._in_flight]
+            self._in_flight = None
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for payload in pending:
+            self.spool.append(payload)
+        if pending:
+            logger.info('IncidentUploader.close: %s',
+                        'spooled %d unsent incidents' % len(pending))
+
+    def _next(self):
+        """
+        :return: (payload, spool offset or None for a queued incident),
+                 None when there is nothing to send
+        """
+        try:
+            return self._queue.get(timeout=0.2), None
+        except queue.Empty:
+            pass
+        return self.spool.peek()
+
+    def _run(self):
+        while not self._closed.is_set():
+            entry = self._next()
+            if entry is None:
+                continue
+            payload, offset = entry
+            with self._lock:
+                if self._closed.is_set():
+                    if offset is None:
+                        self.spool.append(payload)
+                    return
+                if offset is None:
+                    self._in_flight = payload
+            accepted = post_incident(self.domain, payload, self.timeout,
+                                     self.upload_format, self.gzip_json,
+                                     self._session)
+            with self._lock:
+                # close() spools a queued incident while it is in flight
+                spooled = offset is None and self._in_flight is not payload
+                self._in_flight = None
+                if accepted is None:
+                    if offset is None and not spooled:
+                        self.spool.append(payload)
+                elif offset is not None:
+                    self.spool.pop(offset, payload['incident_id'])
+                if self._closed.is_set():
+                    return
+            if accepted is None:
+                self._retry_later(payload)
+                continue
+            self._failures = 0
+            if accepted:
+                self.uploaded_num += 1
+            else:
+                self.rejected_num += 1
+                logger.error('IncidentUploader._run: %s',
+                             'server rejected incident %s'
+                             % payload['incident_id'])
+
+    def _retry_later(self, payload):
+        self.retry_num += 1
+        self._failures += 1
+        delay = min(self.backoff * 2 ** (self._failures - 1), self.max_backoff)
+        logger.warning('IncidentUploader._run: %s',
+                       'upload of incident %s failed %d times in a row,'
+                       ' retry in %.1fs' % (payload['incident_id'],
+                                            self._failures, delay))
+        self._closed.wait(delay)
+
+    def status(self):
+        return {'queued': self._queue.qsize(),
+                'spool_bytes': self.spool.pending_bytes(),
+                'uploaded': self.uploaded_num,
+                'rejected': self.rejected_num,
+                'retries': self.retry_num,
+                'evicted': self.spool.evicted_num}